@@ -4,135 +4,1442 @@
 # https://arxiv.org/abs/1104.3590
 
 import numpy as np
-from collections import OrderedDict
+import scipy.sparse
+import os
+import json
+import time
+import functools
+import abc
+import multiprocessing
+from multiprocessing import shared_memory
+from graph import BookGraph, EdgeValuesView
 
 # the algorithm stops if the increase in log-likelihood
 # for an iteration is less than this value
 epsilon = 1.0
 
+# by default, checkpoints are written after every this many iterations
+checkpoint_every = 10
+
+# stochastic EM (see StochasticEMSteps): the step size of a vertex's t-th update is
+# (t + step_size_delay) ** -step_size_decay, and runs stop after at most this many epochs
+step_size_delay = 1.0
+step_size_decay = 0.6
+max_stochastic_epochs = 20
+# and once an epoch improves the log-likelihood by less than this share of its absolute value
+stochastic_tolerance = 2e-2
+
+# sparse_log_likelihood computes the dot products of this many edges at a time
+sparse_block_size = 1 << 14
+
+# sparse runs stop once this many iterations in a row have not improved on the best objective (see SparseEMSteps)
+sparse_patience = 5
+
+'''
+The edges that the EM updates run over.
+By default these are all the directed edges of the graph in CSR order, so both (u, v) and (v, u).
+With symmetric=True only one copy of each undirected edge is kept (u <= v), which halves the size of q.
+An edge with u < v then stands for two directed edges, so it counts twice in the log-likelihood
+and contributes to theta at both of its endpoints; a self-loop (u, u) counts once.
+
+Input:
+	graph: BookGraph whose edge weights are the number of edges between u and v
+	symmetric: if true, keep only the edges with u <= v
+'''
+class EMEdges:
+	def __init__(self, graph, symmetric=False):
+		self.graph = graph
+		self.symmetric = symmetric
+		if symmetric:
+			upper = graph.sources <= graph.indices
+			self.sources = graph.sources[upper]
+			self.targets = graph.indices[upper]
+			self.weights = graph.weights[upper]
+			off_diagonal = self.sources != self.targets
+			self.multiplicity = np.where(off_diagonal, 2, 1)
+			self.ll_weights = self.multiplicity * self.weights
+			# sums over the edges incident to each vertex, counting both endpoints of each kept edge
+			m = len(self.sources)
+			edge_idxs = np.arange(m)
+			self.incidence = scipy.sparse.csr_matrix(
+				(np.ones(m + np.count_nonzero(off_diagonal)),
+				 (np.concatenate([self.sources, self.targets[off_diagonal]]),
+				  np.concatenate([edge_idxs, edge_idxs[off_diagonal]]))),
+				shape=(graph.n, m))
+			# position of every directed edge of the graph in the kept edges:
+			# (u, v) with u <= v is kept as is, and (u, v) with u > v is stored as (v, u)
+			upper_position = np.cumsum(upper) - 1
+			self.graph_edge_to_kept_edge = upper_position[np.where(upper, np.arange(graph.m), graph.reverse_edges())]
+		else:
+			self.sources = graph.sources
+			self.targets = graph.indices
+			self.weights = graph.weights
+			self.ll_weights = graph.weights
+			self.multiplicity = None
+
+	def __len__(self):
+		return len(self.sources)
+
+	# sum per-edge values over the directed edges out of each vertex
+	# values can also be a sparse matrix with one row per edge, which gives a sparse matrix of sums
+	def vertex_sums(self, values):
+		if self.symmetric:
+			return self.incidence @ values
+		if scipy.sparse.issparse(values):
+			# the edges of each vertex are consecutive, so the incidence matrix shares the graph's indptr
+			incidence = scipy.sparse.csr_matrix((np.ones(len(self)), np.arange(len(self)), self.graph.indptr),
+			                                    shape=(self.graph.n, len(self)))
+			return incidence @ values
+		# edges are in CSR order, so this is a segmented sum over each vertex's rows
+		return self.graph.row_sums(values)
+
+	# sum per-edge values over all directed edges of the graph
+	def total(self, values):
+		if self.symmetric:
+			return np.dot(self.multiplicity, values)
+		return np.sum(values, axis=0)
+
+	# map per-edge values of the kept edges to all directed edges of the graph, in CSR order
+	def expand(self, values):
+		if self.symmetric:
+			return values[self.graph_edge_to_kept_edge]
+		return values
+
+'''
+Calculate theta[i, z] * theta[j, z] for every edge e = (i, j) and community z.
+The row sums are the dot products theta[i]·theta[j], which are needed by both
+the log-likelihood of theta and the next q update, so each iteration computes them once.
+
+Input:
+	edges: EMEdges to compute the products for
+	theta: community probabilities, n * K matrix
+Output:
+	products: m * K matrix, one row per edge in edges
+	theta_dot: theta[i]·theta[j] for every edge, i.e. the row sums of products
+'''
+def edge_theta_products(edges, theta):
+	products = theta[edges.sources] * theta[edges.targets]
+	return products, products.sum(axis=1)
+
 '''
 Calculate the log-likelihood of a given community assignment.
 
 Input:
-	edge_to_weight: dict from vertex index pair (u, v) to number of edges between u and v
+	edges: EMEdges of the graph
 	theta: community probabilities
+	theta_dot: optional theta[i]·theta[j] for every edge, from edge_theta_products
+	verbose: if true, print the edges whose dot product is zero
 Output:
 	log_likelihood: log-likelihood that this community assignment produced the fixed input graph
+	                (-inf if any edge has theta_dot == 0)
+	zero_dot_edges: indices (into edges) of the edges whose theta_dot is zero
+'''
+def log_likelihood(edges, theta, theta_dot=None, verbose=False):
+	if theta_dot is None:
+		_, theta_dot = edge_theta_products(edges, theta)
+	zero_dot_edges = np.flatnonzero(theta_dot == 0)
+	if len(zero_dot_edges) > 0:
+		if verbose:
+			for i, j in zip(edges.sources[zero_dot_edges], edges.targets[zero_dot_edges]):
+				print('theta_dot is zero for edge ({}, {})'.format(i, j))
+		return float('-Inf'), zero_dot_edges
+	left_term = np.dot(edges.ll_weights, np.log(theta_dot))
+	right_term = edges.total(theta_dot)
+	return left_term - right_term, zero_dot_edges
+
+'''
+Update q, the probability that each edge belongs to each community:
+	q[e, z] = theta[i, z] * theta[j, z] / sum_z' theta[i, z'] * theta[j, z']
+for every edge e = (i, j), computed for all edges at once.
+The products are normalized in place, so they become q.
+
+Input:
+	edges: EMEdges of the graph
+	products: theta products for every edge, from edge_theta_products
+	theta_dot: row sums of products
+	verbose: if true, print additional error messages
+Output:
+	q: m * K matrix of edge-community probabilities, one row per edge in edges
+'''
+def update_q(edges, products, theta_dot, verbose):
+	q = products
+	zero_denom = theta_dot == 0
+	if np.any(zero_denom):
+		if verbose:
+			for i, j in zip(edges.sources[zero_denom], edges.targets[zero_denom]):
+				print("Denominator in q is zero: ({}, {})".format(i, j))
+		# edges whose endpoints share no community get q = 0
+		theta_dot = np.where(zero_denom, 1, theta_dot)
+	q /= theta_dot[:, np.newaxis]
+	return q
+
+'''
+Update theta from q. The numerator for vertex i is the sum of weight * q
+over the edges out of i, which for all directed edges is a segmented sum over the
+rows indptr[i] to indptr[i+1] in CSR order. The denominator is the square root of
+the sum of weight * q over all edges, i.e. of the sum of the numerators.
+
+Input:
+	edges: EMEdges of the graph
+	q: m * K matrix of edge-community probabilities
+	verbose: if true, print additional error messages
+Output:
+	theta: community probabilities, n * K matrix
 '''
-def log_likelihood(edge_to_weight, theta):
-	left_term = 0
-	right_term = 0
-	for (i, j), weight in edge_to_weight.items():
-		theta_dot = np.dot(theta[i,:], theta[j,:])
-		# catch errors
-		if theta_dot == 0:
-			print('theta_dot is zero for edge ({}, {})'.format(i, j))
-			exit()
-		left_term += weight * np.log(theta_dot)
-		right_term += theta_dot
-	return left_term - right_term
+def update_theta(edges, q, verbose):
+	weighted_q = edges.weights[:, np.newaxis] * q
+	return normalize_theta(edges.vertex_sums(weighted_q), verbose)
+
+# divide the sums of weight * q at each vertex by the square root of their sum over all vertices, in place
+def normalize_theta(theta, verbose):
+	denom = np.sqrt(theta.sum(axis=0))
+	if verbose:
+		for i, z in zip(*np.nonzero(theta == 0)):
+			print("theta[{},{}] is zero.".format(i, z))
+	theta /= denom
+	return theta
+
+'''
+One EM iteration over the edges of the graph one block of rows at a time (see BookGraph.row_blocks),
+fusing the log-likelihood of theta with the q and theta updates, so each iteration is a single pass
+over the edge arrays and q is only ever held for one block. Memory-mapped graphs are streamed from disk.
+The results are those of log_likelihood, update_q and update_theta, up to the order of floating-point sums.
+
+Input:
+	graph: BookGraph whose edge weights are the number of edges between u and v
+	theta: community probabilities, n * K matrix
+	symmetric: if true, use one copy of each undirected edge (see EMEdges)
+	block_size: maximum number of edges per block
+	verbose: if true, print additional error messages
+Output:
+	ll: log-likelihood of theta (-inf if any edge has theta_dot == 0)
+	next_theta: theta after one more EM update
+	block_bytes: the most memory held by the per-block arrays
+'''
+def blocked_em_iteration(graph, theta, symmetric, block_size, verbose):
+	sums = np.zeros_like(theta)
+	left_term = 0.0
+	right_term = 0.0
+	has_zero_dot = False
+	block_bytes = 0
+	for row_start, row_end in graph.row_blocks(block_size):
+		sources, targets, weights = graph.block_edges(row_start, row_end)
+		multiplicity = None
+		if symmetric:
+			upper = sources <= targets
+			sources, targets, weights = sources[upper], targets[upper], weights[upper]
+			off_diagonal = sources != targets
+			multiplicity = np.where(off_diagonal, 2, 1)
+		products = theta[sources] * theta[targets]
+		theta_dot = products.sum(axis=1)
+		zero_denom = theta_dot == 0
+		if np.any(zero_denom):
+			has_zero_dot = True
+			if verbose:
+				for i, j in zip(sources[zero_denom], targets[zero_denom]):
+					print('theta_dot is zero for edge ({}, {})'.format(i, j))
+			theta_dot = np.where(zero_denom, 1, theta_dot)
+		elif not has_zero_dot:
+			ll_weights = weights if multiplicity is None else multiplicity * weights
+			left_term += np.dot(ll_weights, np.log(theta_dot))
+			right_term += theta_dot.sum() if multiplicity is None else np.dot(multiplicity, theta_dot)
+		# products become weight * q in place
+		products *= (weights / theta_dot)[:, np.newaxis]
+		if symmetric:
+			# weight * q counts at both endpoints of each kept edge
+			endpoints = np.concatenate([sources, targets[off_diagonal]])
+			edge_idxs = np.arange(len(sources))
+			block_incidence = scipy.sparse.csr_matrix(
+				(np.ones(len(endpoints)), (endpoints, np.concatenate([edge_idxs, edge_idxs[off_diagonal]]))),
+				shape=(graph.n, len(sources)))
+			sums += block_incidence @ products
+		else:
+			# the edges of the block are in CSR order, so the sums over its rows are segmented sums
+			block_indptr = graph.indptr[row_start:row_end+1] - graph.indptr[row_start]
+			sums[row_start:row_end] += BookGraph(block_indptr, targets, weights).row_sums(products)
+		block_bytes = max(block_bytes, products.nbytes + sources.nbytes + targets.nbytes + weights.nbytes)
+	ll = float('-Inf') if has_zero_dot else left_term - right_term
+	return ll, normalize_theta(sums, verbose), block_bytes
+
+'''
+Get the most likely community of every edge from theta, one block of rows at a time,
+without holding q for more than one block. This is the argmax of q computed from theta.
+
+Input:
+	graph: BookGraph
+	theta: community probabilities, e.g. q_theta from fit_edge_communities
+	block_size: maximum number of edges per block
+Output:
+	edge_communities: most likely community for each edge, in the graph's CSR edge order,
+	                  in the smallest integer type that holds every community
+'''
+def blocked_edge_communities(graph, theta, block_size=None):
+	edge_communities = np.empty(graph.m, dtype=np.min_scalar_type(max(theta.shape[1] - 1, 0)))
+	for row_start, row_end in graph.row_blocks(block_size):
+		sources, targets, _ = graph.block_edges(row_start, row_end)
+		# q is the products divided by a positive number per edge, so it has the same argmax
+		edge_communities[graph.indptr[row_start]:graph.indptr[row_end]] = np.argmax(theta[sources] * theta[targets], axis=1)
+	return edge_communities
+
+'''
+Truncate the community memberships of every vertex, for sparse runs (see SparseEMSteps).
+Each vertex keeps at most its max_memberships largest entries, and of those only the ones that are
+at least min_membership of the vertex's total. Its largest entry is always kept.
+The pruned entries of a vertex are summarized by their average over the communities it no longer has,
+which is what the objective of sparse runs scores the edges without a shared community with
+(see sparse_edge_theta_products).
+
+Input:
+	theta: nonnegative n * K matrix, dense or sparse, e.g. theta or the sums of weight * q
+	max_memberships: maximum number of communities per vertex, or None for no limit
+	min_membership: smallest share of a vertex's total that is kept, or None for no threshold
+Output:
+	theta: n * K CSR matrix with only the kept entries
+	residual: for every vertex, the sum of its pruned entries divided by the number of communities
+	          it is not a member of (zero if nothing was pruned)
+'''
+def truncate_memberships(theta, max_memberships=None, min_membership=None):
+	theta = scipy.sparse.csr_matrix(theta)
+	theta.eliminate_zeros()
+	n, K = theta.shape
+	rows = np.repeat(np.arange(n), np.diff(theta.indptr))
+	# sort the entries of each row from largest to smallest, and rank them within their row
+	order = np.lexsort((-theta.data, rows))
+	rank = np.empty(len(order), dtype=np.int64)
+	rank[order] = np.arange(len(order)) - theta.indptr[rows[order]]
+	keep = np.ones(len(rank), dtype=bool)
+	if max_memberships is not None:
+		keep &= rank < max_memberships
+	if min_membership is not None:
+		row_totals = np.bincount(rows, weights=theta.data, minlength=n)
+		keep &= theta.data >= min_membership * row_totals[rows]
+	keep |= rank == 0
+	num_kept = np.bincount(rows[keep], minlength=n)
+	pruned = np.bincount(rows[~keep], weights=theta.data[~keep], minlength=n)
+	residual = pruned / np.maximum(K - num_kept, 1)
+	indptr = np.concatenate([[0], np.cumsum(num_kept)])
+	return scipy.sparse.csr_matrix((theta.data[keep], theta.indices[keep], indptr), shape=theta.shape), residual
+
+# multiply every row of a CSR matrix by its value, in place
+def scale_rows(matrix, values):
+	matrix.data *= np.repeat(values, np.diff(matrix.indptr))
+	return matrix
+
+'''
+Calculate theta[i, z] * theta[j, z] for every edge e = (i, j), like edge_theta_products, but for a sparse theta:
+only the communities that both endpoints are members of are computed, so each row has at most as many
+entries as the endpoint with the fewest memberships.
+
+An edge whose endpoints share no community gets its q from the pruned entries (see sparse_update_q),
+which are taken to be the same small value delta for both endpoints, so its theta_dot is
+delta * (sum_z theta[i, z] + sum_z theta[j, z]). delta is the mean of the two endpoints' residuals.
+This way the objective of sparse runs (log_likelihood of these theta_dot) scores every edge under the q it is given,
+and a theta that leaves edges without a shared community is penalized instead of rewarded.
+It is not the log-likelihood of theta, in which such edges have theta_dot == 0 (see sparse_log_likelihood).
+
+Input:
+	edges: EMEdges to compute the products for
+	theta: community probabilities, n * K CSR matrix
+	residual: optional average pruned entry of every vertex, from truncate_memberships (default: zero)
+Output:
+	products: m * K CSR matrix, one row per edge in edges, without entries for the edges whose endpoints share no community
+	theta_dot: theta[i]·theta[j] for every edge
+'''
+def sparse_edge_theta_products(edges, theta, residual=None):
+	products = scipy.sparse.csr_matrix(theta[edges.sources].multiply(theta[edges.targets]))
+	theta_dot = np.asarray(products.sum(axis=1)).ravel()
+	unshared = np.flatnonzero(np.diff(products.indptr) == 0)
+	if residual is not None and len(unshared) > 0:
+		sources, targets = edges.sources[unshared], edges.targets[unshared]
+		row_totals = np.asarray(theta.sum(axis=1)).ravel()
+		delta = (residual[sources] + residual[targets]) / 2
+		theta_dot[unshared] = delta * (row_totals[sources] + row_totals[targets])
+	return products, theta_dot
+
+'''
+Update q like update_q, for the sparse products of sparse_edge_theta_products.
+Truncating theta treats the pruned memberships of a vertex as small rather than zero,
+so an edge whose endpoints share no community gets q proportional to theta[i, z] + theta[j, z]
+over the communities of either endpoint: the limit of q as the pruned entries, taken to be equal, go to zero.
+This lets communities spread to the vertices along such edges instead of dropping the edges for good.
+
+Input:
+	edges: EMEdges of the graph
+	theta: community probabilities that the products were computed from, n * K CSR matrix
+	products: theta products for every edge, from sparse_edge_theta_products
+	theta_dot: theta[i]·theta[j] for every edge, from sparse_edge_theta_products
+	verbose: if true, print the number of edges whose endpoints share no community
+Output:
+	q: m * K CSR matrix of edge-community probabilities, one row per edge in edges
+'''
+def sparse_update_q(edges, theta, products, theta_dot, verbose):
+	unshared = np.flatnonzero(np.diff(products.indptr) == 0)
+	q = scale_rows(products, 1 / np.where(theta_dot == 0, 1, theta_dot))
+	if len(unshared) == 0:
+		return q
+	if verbose:
+		print('{} edges share no community between their endpoints'.format(len(unshared)))
+	union = scipy.sparse.csr_matrix(theta[edges.sources[unshared]] + theta[edges.targets[unshared]])
+	scale_rows(union, 1 / np.asarray(union.sum(axis=1)).ravel())
+	placement = scipy.sparse.csr_matrix((np.ones(len(unshared)), (unshared, np.arange(len(unshared)))),
+	                                    shape=(len(edges), len(unshared)))
+	return q + placement @ union
+
+'''
+Update theta from a sparse q like update_theta, then truncate the memberships of every vertex
+(see truncate_memberships) before normalizing, so the columns of theta keep their normalization.
+The residuals are normalized by the average column, since the pruned entries have no column of their own.
+
+Input:
+	edges: EMEdges of the graph
+	q: m * K CSR matrix of edge-community probabilities
+	max_memberships, min_membership: see truncate_memberships
+Output:
+	theta: community probabilities, n * K CSR matrix
+	residual: average pruned entry of every vertex, on the scale of theta
+'''
+def sparse_update_theta(edges, q, max_memberships, min_membership):
+	sums, residual = truncate_memberships(edges.vertex_sums(scale_rows(q.copy(), edges.weights)), max_memberships, min_membership)
+	theta, column_sums = normalize_sparse_theta(sums)
+	residual /= np.sqrt(column_sums.mean())
+	return theta, residual
+
+# divide the columns of a CSR matrix of sums of weight * q by the square roots of their sums, in place, like normalize_theta
+# returns the normalized matrix and the column sums
+def normalize_sparse_theta(sums):
+	column_sums = np.asarray(sums.sum(axis=0)).ravel()
+	sums.data /= np.sqrt(column_sums)[sums.indices]
+	return sums, column_sums
+
+'''
+Calculate the log-likelihood of a sparse theta, like log_likelihood, computing theta[i]·theta[j]
+for sparse_block_size edges at a time, since the rows of a theta that was not truncated can have up to K entries.
+Unlike the objective of sparse runs (see sparse_edge_theta_products), every edge is scored by theta alone,
+so edges whose endpoints share no community make it -inf.
+
+Input:
+	edges: EMEdges of the graph
+	theta: community probabilities, n * K CSR matrix
+	verbose: if true, print the edges whose dot product is zero
+Output:
+	log_likelihood: log-likelihood that theta produced the graph
+'''
+def sparse_log_likelihood(edges, theta, verbose=False):
+	theta_dot = np.empty(len(edges))
+	for start in range(0, len(edges), sparse_block_size):
+		end = min(start + sparse_block_size, len(edges))
+		block_products = theta[edges.sources[start:end]].multiply(theta[edges.targets[start:end]])
+		theta_dot[start:end] = np.asarray(block_products.sum(axis=1)).ravel()
+	ll, _ = log_likelihood(edges, None, theta_dot, verbose)
+	return ll
+
+# bytes held by the arrays of a sparse matrix
+def sparse_nbytes(matrix):
+	return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
 
 '''
 Run the community detection algorithm once.
+Every mode of the algorithm runs through this driver, which handles the seed, the initialization of theta
+or the checkpoint to resume from, and the start and end records, and leaves the iterations to iterate_em.
+The modes only differ in their EM steps (see EMSteps): DenseEMSteps by default,
+BlockedEMSteps with block_size, SparseEMSteps with max_memberships or min_membership,
+and StochasticEMSteps followed by BlockedEMSteps with batch_size.
 
 Input:
-	edge_to_weight: dict from vertex index pair (u, v) to number of edges between u and v
-	   i.e. edge_to_weight[(u, v)] = number of edges between u and v
-	vertex_to_neighbors: dict from vertex index to a list of all neighboring vertex indices
-	n: number of vertices in the graph
+	graph: BookGraph whose edge weights are the number of edges between u and v
     K: number of communities
     verbose: if true, print additional error messages
+    seed: seed for the random initialization of theta, or None for a random seed
+    symmetric: if true, keep only one copy of each undirected edge in q (see EMEdges)
+    init: function (rng, n, K) -> initial theta, e.g. a partial of split_largest_community
+          to warm-start from a solution with fewer communities (default: random_theta)
+    checkpoint_path: optional .npz file for checkpoints of the EM state (see save_checkpoint).
+                     If it exists, the run resumes from it instead of initializing theta,
+                     and continues exactly as the interrupted run would have
+    num_iterations_per_checkpoint: how often to write checkpoints (default: checkpoint_every)
+    tolerance: stop once the log-likelihood changes by less than this (default: epsilon).
+               Resuming a converged run's checkpoint with a smaller tolerance refines it
+    callback: optional function that is called with a record (dict) at the start of the run,
+              after every iteration and at the end, e.g. an EMTrace
+    block_size: if given, pass over the edges in blocks of at most this many edges instead of
+                holding q for all edges (see BlockedEMSteps), e.g. for memory-mapped graphs
+    batch_size: if given, run stochastic EM on mini-batches of this many edges (see StochasticEMSteps)
+    exact_iterations: maximum number of exact EM iterations that finish a stochastic run
+    max_memberships, min_membership: if either is given, keep only the largest community memberships of every vertex,
+                                     at most max_memberships of them and each at least min_membership of the vertex's total,
+                                     and hold theta and q as sparse matrices (see SparseEMSteps)
+    max_iterations: maximum number of iterations, or None for no limit (stochastic runs use exact_iterations)
 Output:
 	ll: log-likelihood of returned community assignment
-	C: dict from edge to most likely community for that edge
-	   i.e. C[(i, j)] = most likely community for edge (i, j)
+	edge_communities: most likely community for each edge, in the graph's CSR edge order
+	theta: community probabilities, n * K matrix
+	q_theta: the theta that the final q (and so edge_communities) was computed from,
+	         for recomputing the soft memberships with get_edge_memberships
+	theta and q_theta are n * K CSR matrices for sparse runs
+'''
+def fit_edge_communities(graph, K, verbose, seed=None, symmetric=False, init=None,
+                         checkpoint_path=None, num_iterations_per_checkpoint=None, tolerance=None, callback=None,
+                         block_size=None, batch_size=None, exact_iterations=0, max_memberships=None, min_membership=None,
+                         max_iterations=None):
+	sparse = max_memberships is not None or min_membership is not None
+	if sparse and (checkpoint_path is not None or block_size is not None or batch_size is not None):
+		raise ValueError('sparse runs do not support checkpoints, blocks or mini-batches')
+	if batch_size is not None and checkpoint_path is not None:
+		raise ValueError('stochastic runs do not support checkpoints')
+	start_time = time.perf_counter()
+	n = graph.n
+	if tolerance is None:
+		tolerance = epsilon
+	if num_iterations_per_checkpoint is None:
+		num_iterations_per_checkpoint = checkpoint_every
+
+	rng = np.random.default_rng(seed)
+
+	# the phases of the run: EM steps, and the options of iterate_em for them
+	if sparse:
+		phases = [(SparseEMSteps(graph, symmetric, verbose, max_memberships, min_membership),
+		           {'max_iterations': max_iterations, 'keep_best': True, 'patience': sparse_patience})]
+	elif batch_size is not None:
+		phases = [(StochasticEMSteps(graph, rng, batch_size, block_size),
+		           {'relative_tolerance': stochastic_tolerance, 'max_iterations': max_stochastic_epochs, 'keep_best': True, 'event': 'epoch'})]
+		if exact_iterations > 0:
+			phases.append((BlockedEMSteps(graph, symmetric, verbose, block_size), {'max_iterations': exact_iterations}))
+	elif block_size is not None:
+		phases = [(BlockedEMSteps(graph, symmetric, verbose, block_size), {'max_iterations': max_iterations})]
+	else:
+		phases = [(DenseEMSteps(graph, symmetric, verbose), {'max_iterations': max_iterations})]
+
+	resumed = checkpoint_path is not None and os.path.exists(checkpoint_path)
+	if resumed:
+		theta, q_theta, iteration, ll_history = load_checkpoint(checkpoint_path, rng, n, K)
+	else:
+		# initialize theta: n * K matrix
+		theta = (init or random_theta)(rng, n, K)
+		q_theta = None
+
+	run_fields = {'K': K, 'seed': seed}
+	num_iterations = {'iteration': 0, 'epoch': 0}
+	peak_array_bytes = 0
+	for phase, (steps, options) in enumerate(phases):
+		theta, ll, array_bytes = steps.start(theta)
+		peak_array_bytes = max(peak_array_bytes, array_bytes)
+		if phase == 0 and callback is not None:
+			callback(dict({'event': 'start'}, **run_fields, n=n, num_edges=steps.num_edges, symmetric=symmetric,
+			              resumed=resumed, iteration=iteration if resumed else 0,
+			              log_likelihood=ll_history[-1] if resumed else ll,
+			              init_seconds=time.perf_counter() - start_time, **steps.start_fields))
+		if phase > 0 or not resumed:
+			# a later phase continues from the best theta of the previous one, whose q it has not computed
+			ll_history = [ll]
+			q_theta = theta if phase > 0 else None
+		ll, theta, q_theta, best_iteration, num_iterations[options.get('event', 'iteration')], array_bytes = iterate_em(
+			steps, theta, q_theta, ll_history, tolerance, run_fields=run_fields, callback=callback, checkpoint_path=checkpoint_path,
+			num_iterations_per_checkpoint=num_iterations_per_checkpoint, rng=rng, **options)
+		peak_array_bytes = max(peak_array_bytes, array_bytes)
+
+	# q_theta is None only if no iteration was run
+	ll, edge_communities, theta, q_theta, end_fields = steps.finish(ll, theta, theta if q_theta is None else q_theta)
+	if batch_size is not None:
+		end_fields['epochs'] = num_iterations['epoch']
+	if callback is not None:
+		callback(dict({'event': 'end'}, **run_fields, iterations=num_iterations['iteration'], log_likelihood=ll,
+		              seconds=time.perf_counter() - start_time, peak_array_bytes=peak_array_bytes,
+		              best_iteration=best_iteration, **end_fields))
+	return ll, edge_communities, theta, q_theta
+
 '''
-def ball_karrer_newman_algorithm(edge_to_weight, vertex_to_neighbors, n, K, verbose):
-	m = len(edge_to_weight)
-
-	rng = np.random.default_rng()
-
-	# randomly initialize: theta: n * K matrix
-	#                      q: (n * n) * K matrix
-	theta = np.abs(rng.uniform(size=(n, K)))
-	q = np.abs(rng.uniform(size=(m, K)))
-
-	# index of each edge in q
-	edge_indices = {(i,j): idx for idx, (i,j) in enumerate(edge_to_weight.keys())}
-	edges_in_order = list(edge_to_weight.keys())
-	edge_weights_in_order = np.array(list(edge_to_weight.values()))
-	
-	delta = float('Inf')
-	iteration = 0
-	ll = log_likelihood(edge_to_weight, theta)
-	# iterate until the change in log-likelihood is less than epsilon
-	while np.abs(delta) >= epsilon:
+Iterate EM steps from theta, writing checkpoints and calling the callback with a record after every iteration,
+until the log-likelihood changes by less than the larger of tolerance and relative_tolerance * |log-likelihood|,
+or for at most max_iterations iterations.
+
+The log-likelihood of exact EM is over the edges of the graph only, so it can drop in the first iterations
+before it rises again. By default, runs therefore only stop once it changes by less than the tolerance,
+and the last theta is returned. Modes whose steps are not EM steps (sparse and stochastic runs)
+set keep_best instead: then runs stop once patience iterations in a row have not improved on the best
+log-likelihood by the tolerance, and the best theta seen is returned. The final checkpoint has
+the returned theta, so resuming a finished run continues from it.
+
+Input:
+	steps: EMSteps whose start has been called with theta
+	theta: community probabilities to start from
+	q_theta: the theta that the q before theta was computed from, or None
+	ll_history: log-likelihood before the first iteration and after every iteration so far;
+	            iterations are numbered from its length, and it gets the log-likelihood of every new iteration
+	tolerance, relative_tolerance: see above
+	max_iterations: maximum number of iterations, or None for no limit
+	keep_best: if true, stop once the log-likelihood stops improving, and return the best theta seen
+	patience: with keep_best, number of iterations in a row without improvement to stop after
+	event: event of the records, 'iteration' or 'epoch'
+	run_fields: fields of every record, i.e. the K and seed of the run
+	callback: optional function that is called with the record of every iteration
+	checkpoint_path, num_iterations_per_checkpoint: optional file to save the state to (see save_checkpoint), and how often
+	rng: numpy random generator of the run, which checkpoints save
+Output:
+	ll, theta, q_theta: the returned log-likelihood, its theta and the theta that its q was computed from
+	best_iteration: the iteration that reached them
+	num_iterations: number of iterations run
+	peak_array_bytes: the most memory held by the EM arrays during an iteration
+'''
+def iterate_em(steps, theta, q_theta, ll_history, tolerance, relative_tolerance=0, max_iterations=None, keep_best=False, patience=1,
+               event='iteration', run_fields=None, callback=None, checkpoint_path=None, num_iterations_per_checkpoint=None, rng=None):
+	iteration = len(ll_history) - 1
+	start_iteration = iteration
+	ll = ll_history[-1]
+	delta = ll_history[-1] - ll_history[-2] if len(ll_history) > 1 else float('Inf')
+	best = (ll, theta, q_theta, iteration)
+	num_without_improvement = 0
+	peak_array_bytes = 0
+	# a resumed run may have converged already; a delta that is nan (from -inf to -inf) also stops the run
+	stop = not np.abs(delta) >= max(tolerance, relative_tolerance * np.abs(ll))
+	while not stop and (max_iterations is None or iteration - start_iteration < max_iterations):
 		iteration += 1
-		print('Iteration {}'.format(iteration))
-		# update q
-		print('\tUpdating q.')
-		for idx, (i, j) in enumerate(edges_in_order):
-			denom = np.dot(theta[i,:], theta[j,:])
-			if verbose and denom == 0:
-				print("Denominator in q is zero: ({}, {})".format(i, j))
-			for z in range(K):
-				if denom == 0:
-					q[idx,z] = 0
-				else:
-					q[idx,z] = (theta[i, z] * theta[j, z]) / denom
-		# update theta
-		print('\tUpdating theta.')
-		for z in range(K):
-			denom = np.sqrt(np.dot(edge_weights_in_order, q[:, z]))
-			for i in range(n):
-				ends = vertex_to_neighbors[i]
-				start_idx = edge_indices[(i, ends[0])]
-				end_idx = edge_indices[(i, ends[-1])] + 1
-				dot = np.dot(edge_weights_in_order[start_idx:end_idx], q[start_idx:end_idx, z])
-				if verbose and dot == 0:
-				 	print("theta[{},{}] is zero.".format(i, z))
-				theta[i,z] = dot / denom
-		
-		# calculate how much the log-likelihood has changed
-		new_ll = log_likelihood(edge_to_weight, theta)
+		q_theta = theta
+		theta, new_ll, record, array_bytes = steps.step(theta)
+		step_end = time.perf_counter()
 		delta = new_ll - ll
 		ll = new_ll
-		print('\tlog_likelihood: {:.8f} ({:.2f} delta)'.format(ll, delta))
+		ll_history.append(ll)
+		threshold = max(tolerance, relative_tolerance * np.abs(ll))
+		if keep_best:
+			num_without_improvement = 0 if ll >= best[0] + threshold else num_without_improvement + 1
+			stop = num_without_improvement >= patience
+			if ll > best[0]:
+				best = (ll, theta, q_theta, iteration)
+		else:
+			stop = not np.abs(delta) >= threshold
+		if checkpoint_path is not None and iteration % num_iterations_per_checkpoint == 0:
+			save_checkpoint(checkpoint_path, theta, q_theta, iteration, ll_history, rng)
+		peak_array_bytes = max(peak_array_bytes, array_bytes)
+		if callback is not None:
+			callback(dict({'event': event}, **(run_fields or {}), **{event: iteration}, log_likelihood=ll, delta=delta,
+			              **record, checkpoint_seconds=time.perf_counter() - step_end))
+	if keep_best:
+		ll, theta, q_theta, iteration = best
+	if checkpoint_path is not None:
+		save_checkpoint(checkpoint_path, theta, q_theta, iteration, ll_history[:iteration + 1], rng)
+	return ll, theta, q_theta, iteration, len(ll_history) - 1 - start_iteration, peak_array_bytes
+
+'''
+The EM steps of one mode of fit_edge_communities, which iterate_em drives.
+Each mode keeps what it needs between steps, e.g. the theta products that the next q update reuses,
+so step must be called with the theta that start or the previous step returned.
+
+	num_edges: number of edges that the steps run over (the rows of q)
+	start_fields: mode-specific fields of the start record
+'''
+class EMSteps(abc.ABC):
+	start_fields = {}
+
+	'''
+	Prepare the steps from the initial theta.
+
+	Input:
+		theta: community probabilities to start from, n * K matrix
+	Output:
+		theta: the theta to start from (sparse runs truncate it)
+		ll: its log-likelihood
+		array_bytes: memory held by the EM arrays
+	'''
+	@abc.abstractmethod
+	def start(self, theta):
+		pass
+
+	'''
+	One step from theta: an EM iteration, or an epoch of stochastic EM.
+
+	Input:
+		theta: the theta returned by start or by the previous step
+	Output:
+		theta: the next theta
+		ll: its log-likelihood
+		record: mode-specific fields of the iteration record, e.g. the seconds spent on every phase
+		array_bytes: the most memory held by the EM arrays during the step
+	'''
+	@abc.abstractmethod
+	def step(self, theta):
+		pass
+
+	'''
+	The outputs of fit_edge_communities from the best theta of the run.
+
+	Input:
+		ll, theta: the best log-likelihood and its theta
+		q_theta: the theta that the q before theta was computed from
+	Output:
+		ll, edge_communities, theta, q_theta: see fit_edge_communities
+		end_fields: mode-specific fields of the end record
+	'''
+	@abc.abstractmethod
+	def finish(self, ll, theta, q_theta):
+		pass
+
+'''
+EM steps over all edges at once: the q update, the theta update and the log-likelihood of the new theta
+(see update_q, update_theta and log_likelihood), with the theta products shared by the log-likelihood and the next q update.
+
+Input:
+	graph: BookGraph whose edge weights are the number of edges between u and v
+	symmetric: if true, keep only one copy of each undirected edge in q (see EMEdges)
+	verbose: if true, print additional error messages
+'''
+class DenseEMSteps(EMSteps):
+	def __init__(self, graph, symmetric, verbose):
+		self.edges = EMEdges(graph, symmetric)
+		self.verbose = verbose
+		self.num_edges = len(self.edges)
+		self.q = None
+		self.q_theta = None
+
+	def start(self, theta):
+		self.products, self.theta_dot = edge_theta_products(self.edges, theta)
+		ll, _ = log_likelihood(self.edges, theta, self.theta_dot, self.verbose)
+		return theta, ll, theta.nbytes + self.products.nbytes
+
+	def step(self, theta):
+		phase_start = time.perf_counter()
+		# q is computed in place from the products, so the last q is no longer needed
+		self.q = None
+		q = update_q(self.edges, self.products, self.theta_dot, self.verbose)
+		q_end = time.perf_counter()
+		next_theta = update_theta(self.edges, q, self.verbose)
+		theta_end = time.perf_counter()
+
+		# the products for the new theta are reused by the next q update
+		self.products, self.theta_dot = edge_theta_products(self.edges, next_theta)
+		ll, _ = log_likelihood(self.edges, next_theta, self.theta_dot, self.verbose)
+		self.q, self.q_theta = q, theta
+		record = {'q_seconds': q_end - phase_start, 'theta_seconds': theta_end - q_end,
+		          'log_likelihood_seconds': time.perf_counter() - theta_end, 'q_bytes': q.nbytes, 'theta_bytes': next_theta.nbytes}
+		# q, the new theta and the new products are all alive at this point
+		return next_theta, ll, record, q.nbytes + theta.nbytes + next_theta.nbytes + self.products.nbytes
+
+	def finish(self, ll, theta, q_theta):
+		if self.q is not None and self.q_theta is q_theta:
+			q = self.q
+		else:
+			# resumed from a checkpoint that had already converged, or the last iteration was not the best:
+			# q is the products divided by a positive number per edge, so it has the same argmax
+			q, _ = edge_theta_products(self.edges, q_theta)
+		# get community of each edge (i,j) by taking community z with largest q[i,j,z]
+		return ll, self.edges.expand(np.argmax(q, axis=1)), theta, q_theta, {}
+
+'''
+EM steps with one pass over the edges per iteration, one block of rows at a time (see blocked_em_iteration),
+without ever holding q for all edges. Memory is O(n * K) plus one block, so graphs whose edge arrays are
+memory-mapped from disk (see load_graph) and do not fit in memory are processed at the speed of reading them.
+Each pass computes the log-likelihood of the current theta together with the next theta,
+so the sequence of thetas and the checkpoints are the same as for DenseEMSteps,
+and a checkpoint of either one can be resumed by the other.
+The iteration records have the seconds of the whole pass (pass_seconds) instead of one per phase,
+and the edge communities have the smallest integer type that holds every community.
+
+Input:
+	graph, symmetric, verbose: see DenseEMSteps
+	block_size: maximum number of edges per block (see BookGraph.row_blocks)
+'''
+class BlockedEMSteps(EMSteps):
+	def __init__(self, graph, symmetric, verbose, block_size=None):
+		self.graph = graph
+		self.symmetric = symmetric
+		self.verbose = verbose
+		self.block_size = block_size
+		self.num_edges = graph.m
+		self.start_fields = {'block_size': block_size}
+
+	def start(self, theta):
+		ll, self.next_theta, block_bytes = blocked_em_iteration(self.graph, theta, self.symmetric, self.block_size, self.verbose)
+		return theta, ll, theta.nbytes + self.next_theta.nbytes + block_bytes
+
+	def step(self, theta):
+		pass_start = time.perf_counter()
+		next_theta = self.next_theta
+		ll, self.next_theta, block_bytes = blocked_em_iteration(self.graph, next_theta, self.symmetric, self.block_size, self.verbose)
+		record = {'pass_seconds': time.perf_counter() - pass_start, 'block_bytes': block_bytes, 'theta_bytes': next_theta.nbytes}
+		return next_theta, ll, record, theta.nbytes + next_theta.nbytes + self.next_theta.nbytes + block_bytes
+
+	def finish(self, ll, theta, q_theta):
+		return ll, blocked_edge_communities(self.graph, q_theta, self.block_size), theta, q_theta, {}
+
+'''
+Steps of stochastic (online) EM, which update theta from random mini-batches of edges instead of from all edges.
+Each step is an epoch: as many batches as there are edges divided by batch_size.
+Its first few epochs improve theta much more than the same time spent on exact iterations,
+so fit_edge_communities runs it as a fast start for up to exact_iterations exact ones (see BlockedEMSteps).
+
+The state is the sum of weight * q over the edges out of each vertex, whose normalized columns are theta
+(see update_theta). For each mini-batch, the edges are sampled uniformly from the directed edges of the graph
+(see sample_edges), and every vertex in the batch moves its sums towards an estimate from its sampled edges:
+the weighted average of q over them, times the vertex's total edge weight (which is what its sums add up to).
+The t-th update of a vertex has step size (t + step_size_delay) ** -step_size_decay, so every vertex
+settles at its own rate. Only the vertices in the batch and the column totals are touched,
+so a batch costs O(batch_size * K), and q is never held for more than one batch.
+
+An epoch costs about two exact iterations. After each epoch the log-likelihood is computed without any update
+(see blocked_log_likelihood), which costs about half an exact iteration. The updates are noisy and their gains
+shrink with the step sizes, so the stochastic phase stops once an epoch improves the log-likelihood by less than
+stochastic_tolerance of its value, i.e. once an epoch gains less than the exact iterations it costs would,
+or after max_stochastic_epochs epochs, and the exact iterations continue from the epoch with the highest
+log-likelihood (an epoch can lower it). This makes the stochastic phase a warm start of a few epochs
+rather than a replacement for exact EM: run longer, it is slower than exact EM to reach the same log-likelihood.
+Without exact iterations, q_theta is theta.
+
+Input:
+	graph: BookGraph whose edge weights are the number of edges between u and v
+	rng: numpy random generator to sample the mini-batches with
+	batch_size: number of edges per mini-batch
+	block_size: maximum number of edges per block for the log-likelihood (see blocked_log_likelihood)
+'''
+class StochasticEMSteps(EMSteps):
+	def __init__(self, graph, rng, batch_size, block_size=None):
+		self.graph = graph
+		self.rng = rng
+		self.batch_size = batch_size
+		self.block_size = block_size
+		self.vertex_weights = graph.degrees().astype(np.float64)
+		self.num_batches = max(1, int(np.ceil(graph.m / batch_size)))
+		self.num_edges = graph.m
+		self.start_fields = {'batch_size': batch_size}
+
+	def start(self, theta):
+		# sums whose normalized columns are theta, and their column totals
+		self.sums = theta * theta.sum(axis=0)
+		self.totals = self.sums.sum(axis=0)
+		self.num_updates = np.zeros(self.graph.n)
+		ll = blocked_log_likelihood(self.graph, theta, self.block_size)
+		return theta, ll, theta.nbytes + self.sums.nbytes + self.batch_size * theta.shape[1] * theta.itemsize
+
+	def step(self, theta):
+		epoch_start = time.perf_counter()
+		sums, totals = self.sums, self.totals
+		for _ in range(self.num_batches):
+			sources, targets, weights = sample_edges(self.graph, self.rng, self.batch_size)
+			# the column scale of theta cancels in q, so the products of the sums give the same q
+			products = sums[sources] * (sums[targets] / totals)
+			theta_dot = products.sum(axis=1)
+			# edges whose endpoints share no community get q = 0, as in update_q
+			products *= (weights / np.where(theta_dot == 0, 1, theta_dot))[:, np.newaxis]
+			# the sampled edges are sorted by source, so the edges of each vertex are consecutive
+			starts = np.flatnonzero(np.concatenate([[True], sources[1:] != sources[:-1]]))
+			vertices = sources[starts]
+			estimate = np.add.reduceat(products, starts, axis=0)
+			estimate *= (self.vertex_weights[vertices] / np.add.reduceat(weights, starts))[:, np.newaxis]
+			step_sizes = (self.num_updates[vertices] + step_size_delay) ** -step_size_decay
+			change = step_sizes[:, np.newaxis] * (estimate - sums[vertices])
+			sums[vertices] += change
+			totals += change.sum(axis=0)
+			self.num_updates[vertices] += 1
+		# recompute the totals so that rounding errors do not build up
+		self.totals = sums.sum(axis=0)
+		next_theta = sums / np.sqrt(self.totals)
+		epoch_end = time.perf_counter()
+		ll = blocked_log_likelihood(self.graph, next_theta, self.block_size)
+		record = {'num_batches': self.num_batches, 'epoch_seconds': epoch_end - epoch_start,
+		          'log_likelihood_seconds': time.perf_counter() - epoch_end}
+		return next_theta, ll, record, theta.nbytes + next_theta.nbytes + sums.nbytes + self.batch_size * theta.shape[1] * theta.itemsize
+
+	def finish(self, ll, theta, q_theta):
+		return ll, blocked_edge_communities(self.graph, q_theta, self.block_size), theta, q_theta, {}
+
+'''
+Sample directed edges of the graph uniformly, with replacement, reading them straight from the CSR arrays.
+
+Input:
+	graph: BookGraph
+	rng: numpy random generator
+	size: number of edges to sample
+Output:
+	sources, targets, weights: endpoints and weights of the sampled edges, sorted by source
+'''
+def sample_edges(graph, rng, size):
+	# sorted positions read memory-mapped edge arrays in order
+	edge_idxs = np.sort(rng.integers(0, graph.m, size=size))
+	sources = np.searchsorted(graph.indptr, edge_idxs, side='right') - 1
+	targets = np.asarray(graph.indices[edge_idxs])
+	weights = np.asarray(graph.weights[edge_idxs], dtype=np.float64)
+	return sources, targets, weights
+
+# the terms weight * log(theta[i]·theta[j]) - theta[i]·theta[j] that log_likelihood adds up over the directed edges (i, j)
+def edge_log_likelihood_terms(theta, sources, targets, weights):
+	theta_dot = np.einsum('ij,ij->i', theta[sources], theta[targets])
+	with np.errstate(divide='ignore'):
+		return weights * np.log(theta_dot) - theta_dot
+
+# the log-likelihood of theta, one block of rows at a time, without the q and theta updates of blocked_em_iteration
+def blocked_log_likelihood(graph, theta, block_size=None):
+	ll = 0.0
+	for row_start, row_end in graph.row_blocks(block_size):
+		ll += edge_log_likelihood_terms(theta, *graph.block_edges(row_start, row_end)).sum()
+	return ll
+
+'''
+EM steps with sparse community memberships: after every theta update, each vertex keeps only its largest memberships
+(see truncate_memberships), and q is only computed over the communities that the two endpoints of each edge share
+(see sparse_update_q). theta and q are CSR matrices, so memory and the cost of an iteration scale with the number
+of memberships per vertex instead of with K, which makes runs with hundreds of communities affordable.
+Only the initial theta is dense, before it is first truncated.
+
+Truncation is not an EM step, so the iterations are driven by an objective that is not the log-likelihood:
+the log-likelihood of the truncated theta, with the edges whose endpoints share no community scored
+under the q they are given (see sparse_edge_theta_products). It is not guaranteed to increase at every iteration,
+so sparse runs stop once sparse_patience iterations in a row have not improved on the best objective by the tolerance,
+and continue from the best truncated theta (see iterate_em).
+The iteration records have this objective as their log_likelihood, and also the number of edges whose endpoints
+share no community (num_unshared_edges) and the total number of memberships (num_memberships).
+
+The returned theta is the theta update from the q of the best truncated theta, without truncation,
+and the returned ll is its log-likelihood (see sparse_log_likelihood), which is that of the model
+and can be compared with dense runs, e.g. across the trials of get_communities or the values of K in sweep_communities.
+The end record also has the objective of the best truncated theta, which is the returned q_theta.
+Truncation costs log-likelihood, more so for graphs whose vertices have neighbors in many communities.
+
+Input:
+	graph, symmetric, verbose: see DenseEMSteps
+	max_memberships: maximum number of communities per vertex, or None for no limit
+	min_membership: smallest share of a vertex's memberships that is kept, or None for no threshold
+'''
+class SparseEMSteps(EMSteps):
+	def __init__(self, graph, symmetric, verbose, max_memberships=None, min_membership=None):
+		self.edges = EMEdges(graph, symmetric)
+		self.verbose = verbose
+		self.max_memberships = max_memberships
+		self.min_membership = min_membership
+		self.num_edges = len(self.edges)
+		self.start_fields = {'max_memberships': max_memberships, 'min_membership': min_membership}
+
+	def start(self, theta):
+		theta, residual = truncate_memberships(theta, self.max_memberships, self.min_membership)
+		self.products, self.theta_dot = sparse_edge_theta_products(self.edges, theta, residual)
+		ll, _ = log_likelihood(self.edges, None, self.theta_dot, self.verbose)
+		return theta, ll, sparse_nbytes(theta) + sparse_nbytes(self.products)
+
+	def step(self, theta):
+		phase_start = time.perf_counter()
+		q = sparse_update_q(self.edges, theta, self.products, self.theta_dot, self.verbose)
+		q_end = time.perf_counter()
+		next_theta, residual = sparse_update_theta(self.edges, q, self.max_memberships, self.min_membership)
+		theta_end = time.perf_counter()
+
+		# the products for the new theta are reused by the next q update
+		self.products, self.theta_dot = sparse_edge_theta_products(self.edges, next_theta, residual)
+		ll, _ = log_likelihood(self.edges, None, self.theta_dot, self.verbose)
+		record = {'q_seconds': q_end - phase_start, 'theta_seconds': theta_end - q_end,
+		          'log_likelihood_seconds': time.perf_counter() - theta_end,
+		          'q_bytes': sparse_nbytes(q), 'theta_bytes': sparse_nbytes(next_theta),
+		          'num_memberships': next_theta.nnz, 'num_unshared_edges': int(np.count_nonzero(np.diff(self.products.indptr) == 0))}
+		return next_theta, ll, record, sparse_nbytes(q) + sparse_nbytes(theta) + sparse_nbytes(next_theta) + sparse_nbytes(self.products)
+
+	def finish(self, ll, theta, q_theta):
+		# one more q update from the best truncated theta, and the theta update from it without truncation
+		products, theta_dot = sparse_edge_theta_products(self.edges, theta)
+		q = sparse_update_q(self.edges, theta, products, theta_dot, self.verbose)
+		next_theta, _ = normalize_sparse_theta(scipy.sparse.csr_matrix(self.edges.vertex_sums(scale_rows(q.copy(), self.edges.weights))))
+		# every row of q has an entry, so this is the community z with largest q[i,j,z]
+		edge_communities = np.asarray(q.argmax(axis=1)).ravel().astype(np.min_scalar_type(max(theta.shape[1] - 1, 0)))
+		return (sparse_log_likelihood(self.edges, next_theta, self.verbose), self.edges.expand(edge_communities),
+		        next_theta, theta, {'objective': ll})
+
+'''
+Structured trace of runs of the EM algorithm: pass it as the callback of fit_edge_communities,
+or as the trace of get_communities or sweep_communities.
+Every record is a dict with an 'event' and the K and seed of its run:
+	'start': one per run, with n, num_edges (the number of rows of q), symmetric, resumed,
+	         iteration, log_likelihood and init_seconds
+	'iteration': one per iteration, with iteration, log_likelihood, delta, the seconds spent on
+	             each phase (q_seconds, theta_seconds, log_likelihood_seconds, checkpoint_seconds),
+	             and the sizes of q and theta in bytes (q_bytes, theta_bytes).
+	             Blocked runs (see BlockedEMSteps) have pass_seconds instead of
+	             the first three phases, and block_bytes instead of q_bytes.
+	             Sparse runs (see SparseEMSteps) also have num_memberships and num_unshared_edges,
+	             and their log_likelihood is the objective of the truncated theta
+	'epoch': one per epoch of a stochastic run (see StochasticEMSteps), with epoch, log_likelihood, delta,
+	         num_batches, epoch_seconds, log_likelihood_seconds and checkpoint_seconds
+	'end': one per run, with iterations, log_likelihood, seconds, peak_array_bytes
+	       (the most memory held by the EM arrays at once) and best_iteration (the iteration whose theta is returned),
+	       epochs for stochastic runs, and the objective of the best truncated theta for sparse runs
+
+Input:
+	print_progress: if true, print every record as it is added
+'''
+class EMTrace:
+	def __init__(self, print_progress=False):
+		self.print_progress = print_progress
+		self.records = []
+
+	def __call__(self, record):
+		self.records.append(record)
+		if self.print_progress:
+			print(format_trace_record(record))
+
+	# total seconds spent in each phase over all iterations
+	def phase_seconds(self):
+		phases = ['q_seconds', 'theta_seconds', 'log_likelihood_seconds', 'pass_seconds', 'epoch_seconds', 'checkpoint_seconds']
+		iterations = [record for record in self.records if record['event'] in ('iteration', 'epoch')]
+		return {phase: sum(record.get(phase, 0) for record in iterations) for phase in phases}
+
+	def save(self, path):
+		with open(path, 'w') as f:
+			json.dump({'phase_seconds': self.phase_seconds(), 'records': self.records}, f, indent=1)
+
+# one line of progress for a record of EMTrace
+def format_trace_record(record):
+	if record['event'] == 'start':
+		return 'Starting {} groups (seed {}) from iteration {}: log_likelihood {:.8f}'.format(
+			record['K'], record['seed'], record['iteration'], record['log_likelihood'])
+	if record['event'] == 'epoch':
+		return 'Epoch {}: log_likelihood {:.8f} ({:.2f} delta), {} batches {:.3f}s, log_likelihood {:.3f}s'.format(
+			record['epoch'], record['log_likelihood'], record['delta'], record['num_batches'],
+			record['epoch_seconds'], record['log_likelihood_seconds'])
+	if record['event'] == 'iteration' and 'pass_seconds' in record:
+		return 'Iteration {}: log_likelihood {:.8f} ({:.2f} delta), pass {:.3f}s'.format(
+			record['iteration'], record['log_likelihood'], record['delta'], record['pass_seconds'])
+	if record['event'] == 'iteration':
+		return 'Iteration {}: log_likelihood {:.8f} ({:.2f} delta), q {:.3f}s, theta {:.3f}s, log_likelihood {:.3f}s'.format(
+			record['iteration'], record['log_likelihood'], record['delta'],
+			record['q_seconds'], record['theta_seconds'], record['log_likelihood_seconds'])
+	return 'Finished {} groups (seed {}) after {} iterations in {:.2f}s: log_likelihood {:.8f}'.format(
+		record['K'], record['seed'], record['iterations'], record['seconds'], record['log_likelihood'])
 
-	# get community of each edge (i,j) by taking community z with largest q[i,j,z]
-	C_list = np.argmax(q, axis=1)
-	C = {}
-	for idx, (i,j) in enumerate(edges_in_order):
-		C[(i,j)] = C_list[idx]
-	return ll, C
+'''
+Save the state of a run of the EM algorithm, so that it can be resumed by fit_edge_communities.
+The state is written to a temporary file first, so an interruption never leaves a partial checkpoint.
+
+Input:
+	path: path of the .npz file
+	theta: current community probabilities, n * K matrix
+	q_theta: theta that the last q was computed from
+	iteration: number of iterations run so far
+	ll_history: log-likelihood before the first iteration and after every iteration
+	rng: numpy random generator of the run
+'''
+def save_checkpoint(path, theta, q_theta, iteration, ll_history, rng):
+	temporary_path = '{}.tmp-{}.npz'.format(path, os.getpid())
+	np.savez(temporary_path, theta=theta, q_theta=q_theta, iteration=iteration,
+	         ll_history=np.array(ll_history), rng_state=json.dumps(rng.bit_generator.state))
+	os.replace(temporary_path, path)
+
+'''
+Load a checkpoint saved by save_checkpoint, and restore the state of the random generator.
+
+Input:
+	path: path of the .npz file
+	rng: numpy random generator to restore the saved state into
+	n, K: expected shape of theta
+Output:
+	theta, q_theta, iteration, ll_history: as passed to save_checkpoint
+'''
+def load_checkpoint(path, rng, n, K):
+	with np.load(path) as checkpoint:
+		theta = checkpoint['theta']
+		if theta.shape != (n, K):
+			raise ValueError('checkpoint {} has theta of shape {}, expected {}'.format(path, theta.shape, (n, K)))
+		rng.bit_generator.state = json.loads(str(checkpoint['rng_state']))
+		return theta, checkpoint['q_theta'], int(checkpoint['iteration']), checkpoint['ll_history'].tolist()
+
+# checkpoint file of one trial of get_communities
+def trial_checkpoint_path(checkpoint_directory, seed):
+	return os.path.join(checkpoint_directory, 'trial-{}.npz'.format(seed))
+
+'''
+The master seed of the runs checkpointed in a directory. The checkpoint files are named after seeds
+derived from it, so it is saved in the directory: running again without a seed then finds the checkpoints
+of the interrupted run, even if its random master seed was never printed.
+
+Input:
+	checkpoint_directory: directory of the checkpoints
+	seed: master seed of the run, or None to reuse the saved one (or pick a random one if there is none)
+Output:
+	seed: master seed to run with, which is now the one saved in the directory
+'''
+def checkpoint_master_seed(checkpoint_directory, seed):
+	path = os.path.join(checkpoint_directory, 'master-seed.json')
+	if seed is None and os.path.exists(path):
+		with open(path, 'r') as f:
+			return json.load(f)
+	if seed is None:
+		seed = np.random.SeedSequence().entropy
+	os.makedirs(checkpoint_directory, exist_ok=True)
+	temporary_path = '{}.tmp-{}'.format(path, os.getpid())
+	with open(temporary_path, 'w') as f:
+		json.dump(seed, f)
+	os.replace(temporary_path, path)
+	return seed
+
+# random initial theta: n * K matrix
+def random_theta(rng, n, K):
+	return np.abs(rng.uniform(size=(n, K)))
+
+'''
+Initial theta for K communities from a solution with K - 1 communities:
+the community with the most expected edges is split in two by randomly
+perturbing each vertex's share of it, and the other communities are kept as they are.
+Each half starts with about half of the community's expected edges.
+
+Input:
+	theta: community probabilities of the K - 1 solution, n * (K - 1) matrix, dense or sparse
+	rng: numpy random generator for the perturbation
+	n: number of vertices
+	K: number of communities to initialize
+Output:
+	theta: n * K matrix
+'''
+def split_largest_community(theta, rng, n, K):
+	if theta.shape != (n, K - 1):
+		raise ValueError('cannot split a theta of shape {} into {} communities of {} vertices'.format(theta.shape, K, n))
+	if scipy.sparse.issparse(theta):
+		theta = theta.toarray()
+	# the expected number of edges in community z is (sum_i theta[i, z])^2
+	z = int(np.argmax(theta.sum(axis=0)))
+	perturbation = rng.uniform(-0.5, 0.5, size=n)
+	half = theta[:, z] / np.sqrt(2)
+	split_theta = np.empty((n, K))
+	split_theta[:, :K-1] = theta
+	split_theta[:, z] = half * (1 + perturbation)
+	split_theta[:, K-1] = half * (1 - perturbation)
+	return split_theta
 
+'''
+Recompute q, the soft community memberships of the edges, from theta.
+This is cheaper to store and send between processes than q itself, since theta is only n * K.
+
+Input:
+	graph: BookGraph
+	theta: community probabilities, e.g. q_theta from fit_edge_communities
+Output:
+	q: m * K matrix of edge-community probabilities, in the graph's CSR edge order
+	   (a CSR matrix if theta is sparse, see sparse_update_q)
+'''
+def get_edge_memberships(graph, theta):
+	edges = EMEdges(graph)
+	if scipy.sparse.issparse(theta):
+		theta = scipy.sparse.csr_matrix(theta)
+		products, theta_dot = sparse_edge_theta_products(edges, theta)
+		return sparse_update_q(edges, theta, products, theta_dot, False)
+	products, theta_dot = edge_theta_products(edges, theta)
+	return update_q(edges, products, theta_dot, False)
+
+'''
+Convert an array of edge communities in CSR edge order to a dict keyed by edge.
+
+Input:
+	graph: BookGraph the communities were computed for
+	edge_communities: most likely community for each edge, in the graph's CSR edge order
+Output:
+	C: dict from edge to most likely community for that edge
+'''
+def edge_communities_to_dict(graph, edge_communities):
+	return dict(zip(zip(graph.sources.tolist(), graph.indices.tolist()), edge_communities.tolist()))
+
+'''
+Run the community detection algorithm once.
+
+Input:
+	graph: BookGraph whose edge weights are the number of edges between u and v
+    K: number of communities
+    verbose: if true, print additional error messages
+    seed: seed for the random initialization of theta, or None for a random seed
+    symmetric: if true, keep only one copy of each undirected edge in q (see EMEdges)
+Output:
+	ll: log-likelihood of returned community assignment
+	C: read-only dict view from edge to most likely community for that edge
+	   i.e. C[(i, j)] = most likely community for edge (i, j)
+'''
+def ball_karrer_newman_algorithm(graph, K, verbose, seed=None, symmetric=False):
+	ll, edge_communities, _, _ = fit_edge_communities(graph, K, verbose, seed, symmetric)
+	return ll, EdgeValuesView(graph, edge_communities)
+
+
+'''
+The best community assignment found over several runs of the algorithm.
+
+	ll: log-likelihood of the best community assignment
+	edge_communities: most likely community for each edge, in the graph's CSR edge order
+	theta: community probabilities of the vertices, n * K matrix
+	q_theta: theta that q was computed from (see fit_edge_communities)
+	q: soft community memberships of the edges, m * K matrix in CSR edge order (computed on first use),
+	   sparse if theta is
+	C: read-only dict view from edge to most likely community, for code that expects the old dict
+	seed: seed of the trial that found the best community assignment
+	master_seed: seed that all trial seeds were derived from
+	trial_seeds: seed of every trial, in trial order
+	trial_log_likelihoods: log-likelihood reached by every trial, in trial order
+'''
+class CommunityResult:
+	def __init__(self, graph, ll, edge_communities, theta, q_theta, seed, master_seed, trial_seeds, trial_log_likelihoods):
+		self.graph = graph
+		self.ll = ll
+		self.edge_communities = edge_communities
+		self.theta = theta
+		self.q_theta = q_theta
+		self.seed = seed
+		self.master_seed = master_seed
+		self.trial_seeds = trial_seeds
+		self.trial_log_likelihoods = trial_log_likelihoods
+		self._q = None
+
+	@property
+	def q(self):
+		if self._q is None:
+			self._q = get_edge_memberships(self.graph, self.q_theta)
+		return self._q
+
+	@property
+	def C(self):
+		return EdgeValuesView(self.graph, self.edge_communities)
+
+# graph arrays that are placed in shared memory for the worker processes
+shared_graph_arrays = ['indptr', 'indices', 'weights']
+
+# the memory-mapped file behind a whole array, as (path, offset), or None if the array is in memory
+def get_memmap_file(array):
+	# walk up to the array that owns the mapping: slices of a memmap are memmaps too, and
+	# arrays from np.frombuffer or shared memory end at a bytes, mmap or memoryview base
+	base = array
+	while isinstance(getattr(base, 'base', None), np.ndarray):
+		base = base.base
+	if not isinstance(base, np.memmap) or base.filename is None or base.shape != array.shape or base.ctypes.data != array.ctypes.data:
+		return None
+	return base.filename, base.offset
+
+'''
+Copy the graph arrays into shared memory so that worker processes can read them without pickling.
+Memory-mapped arrays (see load_graph) are not copied: the workers map the same files.
+
+Input:
+	graph: BookGraph to share
+Output:
+	blocks: list of SharedMemory blocks, which the caller must close and unlink
+	spec: dict from array name to (shared memory name, shape, dtype), for attach_shared_graph,
+	      or to (None, shape, dtype, path, offset) for memory-mapped arrays
+'''
+def share_graph(graph):
+	blocks = []
+	spec = {}
+	for name in shared_graph_arrays:
+		array = getattr(graph, name)
+		memmap_file = get_memmap_file(array)
+		if memmap_file is not None:
+			spec[name] = (None, array.shape, array.dtype.str) + memmap_file
+			continue
+		block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+		np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+		blocks.append(block)
+		spec[name] = (block.name, array.shape, array.dtype.str)
+	return blocks, spec
+
+'''
+Build a read-only BookGraph on top of shared memory created by share_graph.
+
+Input:
+	spec: dict from array name to (shared memory name, shape, dtype), or to (None, shape, dtype, path, offset)
+Output:
+	blocks: list of attached SharedMemory blocks, which must stay referenced while the graph is in use
+	graph: BookGraph backed by the shared memory
+'''
+def attach_shared_graph(spec):
+	blocks = []
+	arrays = {}
+	for name in shared_graph_arrays:
+		block_name, shape, dtype = spec[name][:3]
+		if block_name is None:
+			path, offset = spec[name][3:]
+			arrays[name] = np.memmap(path, dtype=np.dtype(dtype), mode='r', offset=offset, shape=shape)
+			continue
+		# worker processes share the parent's resource tracker, so attaching here
+		# does not change who is responsible for unlinking the block
+		block = shared_memory.SharedMemory(name=block_name)
+		array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+		array.flags.writeable = False
+		blocks.append(block)
+		arrays[name] = array
+	return blocks, BookGraph(arrays['indptr'], arrays['indices'], arrays['weights'])
+
+# the shared graph in each worker process, set by init_worker
+worker_blocks = None
+worker_graph = None
+
+def init_worker(spec):
+	global worker_blocks, worker_graph
+	worker_blocks, worker_graph = attach_shared_graph(spec)
+
+'''
+Run one trial of get_communities.
+
+Input:
+	graph, K, verbose, seed, checkpoint_path: see fit_edge_communities
+	fit_options: dict of the other keyword arguments of fit_edge_communities
+	trace_progress: None to not trace the trial, otherwise print_progress for its EMTrace
+Output:
+	seed, then the outputs of fit_edge_communities, then the trace records (or None)
+'''
+def run_trial(graph, K, verbose, seed, checkpoint_path, fit_options, trace_progress):
+	trace = None if trace_progress is None else EMTrace(trace_progress)
+	result = fit_edge_communities(graph, K, verbose, seed, checkpoint_path=checkpoint_path, callback=trace, **fit_options)
+	return (seed,) + result + (None if trace is None else trace.records,)
+
+def run_worker_trial(args):
+	return run_trial(worker_graph, *args)
 
 '''
 Runs the community detection algorithm multiple times and returns
-the community assignment that achieves the lowest log-likelihood.
+the community assignment that achieves the highest log-likelihood.
+The trials run in parallel in a pool of worker processes that read the graph from shared memory.
+Each trial gets its own seed derived from seed, so the whole run is reproducible.
 
 Input:
-	edge_to_weight: dict from vertex index pair (u, v) to number of edges between u and v
-	   i.e. edge_to_weight[(u, v)] = number of edges between u and v
-	vertex_to_neighbors: dict from vertex index to a list of all neighboring vertex indices
-	n: number of vertices in the graph
+	graph: BookGraph whose edge weights are the number of edges between u and v
     K: number of communities
     num_trials: number of times to run the algorithm
+    verbose: if true, print additional error messages
+    seed: master seed for all trials, or None for a random master seed
+    num_workers: number of worker processes (default: one per CPU, at most num_trials)
+    symmetric: if true, keep only one copy of each undirected edge in q (see EMEdges)
+    init: initialization of theta for every trial (see fit_edge_communities)
+    checkpoint_directory: optional directory for one checkpoint file per trial.
+                          Running again with the same seed, or without one, resumes every trial from its checkpoint
+                          (see checkpoint_master_seed)
+    num_iterations_per_checkpoint, tolerance, block_size, batch_size, exact_iterations,
+    max_memberships, min_membership, max_iterations: see fit_edge_communities
+    trace: optional EMTrace that gets the records of every trial, in trial order
 Output:
-	C: dict from edge to most likely community for that edge
-	   i.e. C[(i, j)] = most likely community for edge (i, j)
+	result: CommunityResult with the best community assignment (result.edge_communities, in CSR edge order),
+	        its soft memberships, the seed that found it and every trial's log-likelihood
 '''
-def get_communities(edge_to_weight, vertex_to_neighbors, n, K, num_trials, verbose):
-	max_ll = float('-Inf')
-	best_C = None
-	for trial in range(num_trials):
-		ll, C = ball_karrer_newman_algorithm(edge_to_weight, vertex_to_neighbors, n, K, verbose)
-		if ll > max_ll:
-			max_ll = ll
-			best_C = C
-	print('Max log-likelihood in {} trials: {:.4f}'.format(num_trials, max_ll))
-	return best_C
+def get_communities(graph, K, num_trials, verbose, seed=None, num_workers=None, symmetric=False, init=None,
+                    checkpoint_directory=None, num_iterations_per_checkpoint=None, tolerance=None, trace=None, block_size=None,
+                    batch_size=None, exact_iterations=0, max_memberships=None, min_membership=None, max_iterations=None):
+	if checkpoint_directory is not None:
+		seed = checkpoint_master_seed(checkpoint_directory, seed)
+	seed_sequence = np.random.SeedSequence(seed)
+	trial_seeds = [int(s) for s in seed_sequence.generate_state(num_trials)]
+	checkpoint_paths = [None] * num_trials
+	if checkpoint_directory is not None:
+		os.makedirs(checkpoint_directory, exist_ok=True)
+		checkpoint_paths = [trial_checkpoint_path(checkpoint_directory, trial_seed) for trial_seed in trial_seeds]
+	if num_workers is None:
+		num_workers = os.cpu_count() or 1
+	num_workers = max(1, min(num_workers, num_trials))
 
+	fit_options = {'symmetric': symmetric, 'init': init, 'num_iterations_per_checkpoint': num_iterations_per_checkpoint, 'tolerance': tolerance,
+	               'block_size': block_size, 'batch_size': batch_size, 'exact_iterations': exact_iterations,
+	               'max_memberships': max_memberships, 'min_membership': min_membership, 'max_iterations': max_iterations}
+	trace_progress = None if trace is None else trace.print_progress
+	trial_args = [(K, verbose, trial_seed, checkpoint_path, fit_options, trace_progress)
+	              for trial_seed, checkpoint_path in zip(trial_seeds, checkpoint_paths)]
+	if num_workers == 1:
+		trials = [run_trial(graph, *args) for args in trial_args]
+	else:
+		blocks, spec = share_graph(graph)
+		try:
+			with multiprocessing.Pool(num_workers, initializer=init_worker, initargs=(spec,)) as pool:
+				trials = pool.map(run_worker_trial, trial_args)
+		finally:
+			for block in blocks:
+				block.close()
+				block.unlink()
 
+	trial_log_likelihoods = [trial[1] for trial in trials]
+	best_trial = int(np.argmax(trial_log_likelihoods))
+	best_seed, max_ll, best_edge_communities, theta, q_theta, _ = trials[best_trial]
+	if trace is not None:
+		for trial in trials:
+			trace.records.extend(trial[-1])
+	print('Max log-likelihood in {} trials: {:.4f} (seed {})'.format(num_trials, max_ll, best_seed))
+	return CommunityResult(graph, max_ll, best_edge_communities, theta, q_theta, best_seed, seed_sequence.entropy, trial_seeds, trial_log_likelihoods)
 
+'''
+Information criterion of a community assignment, for comparing different numbers of communities.
+Lower is better. The free parameters are the n * K entries of theta, and the number of
+observations is the number of edges in the graph, counted with multiplicity.
+
+Input:
+	graph: BookGraph the communities were computed for
+	ll: log-likelihood of the community assignment
+	K: number of communities
+	criterion: 'bic' (Bayesian information criterion) or 'aic' (Akaike information criterion)
+Output:
+	value of the criterion
+'''
+def information_criterion(graph, ll, K, criterion='bic'):
+	num_parameters = graph.n * K
+	if criterion == 'bic':
+		num_observations = graph.weights.sum() / 2
+		return num_parameters * np.log(num_observations) - 2 * ll
+	if criterion == 'aic':
+		return 2 * num_parameters - 2 * ll
+	raise ValueError('unknown information criterion: {}'.format(criterion))
+
+'''
+The community assignments found by sweep_communities, one per number of communities tried.
 
+	results: dict from K to the CommunityResult for K communities
+	criteria: dict from K to the information criterion of that result
+	criterion: name of the information criterion
+	best_K: the K with the lowest criterion
+	best: the CommunityResult for best_K
+'''
+class SweepResult:
+	def __init__(self, results, criteria, criterion, best_K):
+		self.results = results
+		self.criteria = criteria
+		self.criterion = criterion
+		self.best_K = best_K
+
+	@property
+	def best(self):
+		return self.results[self.best_K]
+
+'''
+Run community detection for a range of numbers of communities on the same graph.
+The smallest K starts from random initializations; every later K is warm-started by
+splitting the largest community of the previous K's best solution (see split_largest_community),
+which converges in far fewer iterations than starting over.
+The sweep stops early once the information criterion has not improved for patience values of K in a row.
+
+Input:
+	graph: BookGraph whose edge weights are the number of edges between u and v
+	min_K, max_K: smallest and largest number of communities to try
+	num_trials: number of runs per K (each warm start perturbs the split differently)
+	verbose: if true, print additional error messages
+	seed: master seed for the whole sweep, or None for a random master seed
+	num_workers: number of worker processes per K (see get_communities)
+	symmetric: if true, keep only one copy of each undirected edge in q (see EMEdges)
+	criterion: 'bic' or 'aic' (see information_criterion)
+	patience: number of values of K without improvement before stopping
+	checkpoint_directory: optional directory for checkpoints, with one subdirectory per K (see get_communities).
+	                      Running again with the same seed, or without one, resumes the sweep (see checkpoint_master_seed)
+	num_iterations_per_checkpoint, tolerance, block_size, batch_size, exact_iterations,
+	max_memberships, min_membership, max_iterations: see fit_edge_communities
+	trace: optional EMTrace that gets the records of every run
+Output:
+	sweep: SweepResult with the result and criterion of every K tried
+'''
+def sweep_communities(graph, min_K, max_K, num_trials, verbose, seed=None, num_workers=None, symmetric=False, criterion='bic', patience=2,
+                      checkpoint_directory=None, num_iterations_per_checkpoint=None, tolerance=None, trace=None, block_size=None,
+                      batch_size=None, exact_iterations=0, max_memberships=None, min_membership=None, max_iterations=None):
+	if checkpoint_directory is not None:
+		seed = checkpoint_master_seed(checkpoint_directory, seed)
+	K_seeds = np.random.SeedSequence(seed).generate_state(max_K - min_K + 1)
+	results = {}
+	criteria = {}
+	best_K = None
+	num_without_improvement = 0
+	init = None
+	for K, K_seed in zip(range(min_K, max_K + 1), K_seeds.tolist()):
+		K_checkpoint_directory = None if checkpoint_directory is None else os.path.join(checkpoint_directory, '{}-groups'.format(K))
+		result = get_communities(graph, K, num_trials, verbose, seed=K_seed, num_workers=num_workers, symmetric=symmetric, init=init,
+		                         checkpoint_directory=K_checkpoint_directory, num_iterations_per_checkpoint=num_iterations_per_checkpoint,
+		                         tolerance=tolerance, trace=trace, block_size=block_size, batch_size=batch_size,
+		                         exact_iterations=exact_iterations, max_memberships=max_memberships, min_membership=min_membership,
+		                         max_iterations=max_iterations)
+		results[K] = result
+		criteria[K] = information_criterion(graph, result.ll, K, criterion)
+		print('K = {}: log-likelihood {:.4f}, {} {:.4f}'.format(K, result.ll, criterion.upper(), criteria[K]))
+		if best_K is None or criteria[K] < criteria[best_K]:
+			best_K = K
+			num_without_improvement = 0
+		else:
+			num_without_improvement += 1
+			if num_without_improvement >= patience:
+				break
+		init = functools.partial(split_largest_community, result.theta)
+	return SweepResult(results, criteria, criterion, best_K)
@@ -0,0 +1,283 @@
+import numpy as np
+import json
+from array import array
+from collections import defaultdict
+
+# number of characters read from a JSON file at a time when streaming it
+json_chunk_size = 1 << 20
+
+'''
+Iterate over the elements of a JSON file that contains one top-level array,
+decoding one element at a time, so the whole file is never held in memory.
+
+Input:
+    path: path of the JSON file
+    chunk_size: number of characters to read at a time
+Output:
+    generator of the decoded elements of the array
+'''
+def iter_json_array(path, chunk_size=json_chunk_size):
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buffer = f.read(chunk_size)
+        at_end = len(buffer) == 0
+        pos = 0
+        # skip everything up to the opening bracket
+        while True:
+            start = buffer.find('[', pos)
+            if start >= 0:
+                pos = start + 1
+                break
+            if at_end:
+                raise ValueError('{} does not contain a JSON array'.format(path))
+            buffer = f.read(chunk_size)
+            at_end = len(buffer) == 0
+            pos = 0
+        while True:
+            # skip whitespace and the comma between elements
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ','):
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                if pos == len(buffer):
+                    raise json.JSONDecodeError('Need more data', buffer, pos)
+                element, end = decoder.raw_decode(buffer, pos)
+                # an element is only complete once the character after it is read: a number
+                # cut off at the end of the buffer (like -2. of -2.5) also decodes
+                if not at_end and (end == len(buffer) or not (buffer[end].isspace() or buffer[end] in ',]')):
+                    raise json.JSONDecodeError('Need more data', buffer, end)
+            except json.JSONDecodeError:
+                # the next element is cut off at the end of the buffer, so read more of the file
+                if at_end:
+                    raise
+                more = f.read(chunk_size)
+                at_end = len(more) == 0
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            pos = end
+            yield element
+
+'''
+Parse an event date from the Shakespeare and Company dataset.
+Dates can be partial: '1921-03-17', '1921-03' and '1921' are all valid,
+and partial dates are rounded down to the first day of the month or year.
+Dates without a year (e.g. '--03-17') and missing dates are NaT.
+
+Input:
+    date: date string or None
+Output:
+    date: numpy datetime64 with day precision
+'''
+def parse_event_date(date):
+    if not date or date.startswith('-'):
+        return np.datetime64('NaT', 'D')
+    try:
+        return np.datetime64(date, 'D')
+    except ValueError:
+        return np.datetime64('NaT', 'D')
+
+'''
+Columnar store of the Shakespeare and Company events, built in one pass over the events.
+Events are sorted by event type (and otherwise keep their order in the dataset),
+so all events of one type are a contiguous slice: type_offsets[t] to type_offsets[t+1].
+Every query below is a set of array operations on these slices.
+
+    event_types: sorted list of event type names, e.g. 'Borrow'
+    type_offsets: array of length len(event_types) + 1 with the start of each type's events
+    book_uris: list of book URIs; book_index refers to positions in this list
+    member_uris: list of member URIs; member_indices refers to positions in this list
+    book_index: book of each event, or -1 for events without a book (e.g. subscriptions)
+    start_dates: start date of each event as datetime64[D], NaT if unknown
+    end_dates: end date of each event as datetime64[D], NaT if unknown
+    member_indptr, member_indices: the members of event e are member_indices[member_indptr[e]:member_indptr[e+1]]
+'''
+class EventStore:
+    def __init__(self, event_types, type_codes, book_uris, book_index, member_uris, member_indptr, member_indices, start_dates, end_dates):
+        # sort the events by type, keeping the dataset order within each type
+        order = np.argsort(type_codes, kind='stable')
+        self.event_types = event_types
+        self.type_offsets = np.zeros(len(event_types) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(type_codes, minlength=len(event_types)), out=self.type_offsets[1:])
+        self.book_uris = book_uris
+        self.book_uri_to_index = {uri: i for i, uri in enumerate(book_uris)}
+        self.member_uris = member_uris
+        self.member_uri_to_index = {uri: i for i, uri in enumerate(member_uris)}
+        self.book_index = book_index[order]
+        self.start_dates = start_dates[order]
+        self.end_dates = end_dates[order]
+        num_members = np.diff(member_indptr)[order]
+        self.member_indptr = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(num_members, out=self.member_indptr[1:])
+        self.member_indices = member_indices[self.expand_ranges(member_indptr[:-1][order], num_members)]
+
+    '''
+    Build the store from event dicts, e.g. the list loaded by load_shakespeare_and_company_data.
+    Only the event type, item URI, member URIs and dates are kept, and they are appended to
+    typed arrays as the events are read, so events can also come from a generator (see from_json_file).
+
+    Input:
+        events: iterable of event dicts for Shakespeare and Company
+    Output:
+        store: EventStore
+    '''
+    @classmethod
+    def from_events(cls, events):
+        type_to_code = {}
+        book_uri_to_index = {}
+        member_uri_to_index = {}
+        type_codes = array('i')
+        book_index = array('i')
+        # dates as days since 1970-01-01, the integer representation of datetime64[D]
+        start_dates = array('q')
+        end_dates = array('q')
+        member_indptr = array('q', [0])
+        member_indices = array('i')
+        for event in events:
+            type_codes.append(type_to_code.setdefault(event['event_type'], len(type_to_code)))
+            book_uri = (event.get('item') or {}).get('uri')
+            book_index.append(-1 if book_uri is None else book_uri_to_index.setdefault(book_uri, len(book_uri_to_index)))
+            start_dates.append(parse_event_date(event.get('start_date')).astype(np.int64))
+            end_dates.append(parse_event_date(event.get('end_date')).astype(np.int64))
+            for member_uri in (event.get('member') or {}).get('uris', []):
+                member_indices.append(member_uri_to_index.setdefault(member_uri, len(member_uri_to_index)))
+            member_indptr.append(len(member_indices))
+        return cls.from_codes(type_to_code, np.frombuffer(type_codes, dtype=np.int32), book_uri_to_index,
+                              np.frombuffer(book_index, dtype=np.int32), member_uri_to_index,
+                              np.frombuffer(member_indptr, dtype=np.int64), np.frombuffer(member_indices, dtype=np.int32),
+                              np.frombuffer(start_dates, dtype=np.int64).view('datetime64[D]'),
+                              np.frombuffer(end_dates, dtype=np.int64).view('datetime64[D]'))
+
+    '''
+    Build the store by streaming a SCoData events JSON file, one event at a time.
+    Peak memory stays close to the size of the final columns instead of the size of the decoded JSON.
+
+    Input:
+        path: path of the events JSON file
+    Output:
+        store: EventStore
+    '''
+    @classmethod
+    def from_json_file(cls, path):
+        return cls.from_events(iter_json_array(path))
+
+    '''
+    Build the store from integer-coded columns, renumbering the event types in sorted order.
+
+    Input:
+        type_to_code: dict from event type name to the code used in type_codes
+        book_uri_to_index, member_uri_to_index: dicts from URI to the index used in book_index and member_indices
+        the other arguments are the columns described in the class documentation, in dataset order
+    Output:
+        store: EventStore
+    '''
+    @classmethod
+    def from_codes(cls, type_to_code, type_codes, book_uri_to_index, book_index, member_uri_to_index,
+                   member_indptr, member_indices, start_dates, end_dates):
+        event_types = sorted(type_to_code)
+        renumber = np.zeros(len(event_types), dtype=np.int32)
+        for new_code, event_type in enumerate(event_types):
+            renumber[type_to_code[event_type]] = new_code
+        book_uris = [None] * len(book_uri_to_index)
+        for uri, i in book_uri_to_index.items():
+            book_uris[i] = uri
+        member_uris = [None] * len(member_uri_to_index)
+        for uri, i in member_uri_to_index.items():
+            member_uris[i] = uri
+        return cls(event_types, renumber[type_codes], book_uris, book_index, member_uris,
+                   member_indptr, member_indices, start_dates, end_dates)
+
+    # number of events
+    def __len__(self):
+        return len(self.book_index)
+
+    # concatenation of the ranges start[i] to start[i] + length[i]
+    @staticmethod
+    def expand_ranges(starts, lengths):
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(np.sum(lengths))
+
+    # indices of all events of the given types, in sorted order
+    def events_of_types(self, event_types):
+        ranges = [np.arange(self.type_offsets[t], self.type_offsets[t+1])
+                  for t, event_type in enumerate(self.event_types) if event_type in event_types]
+        if len(ranges) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(ranges)
+
+    '''
+    Select events by type, date and book.
+
+    Input:
+        event_types: event type names to keep, e.g. ['Borrow']
+        start_date, end_date: optional date strings; keep events whose start date is in [start_date, end_date)
+                              (events with an unknown start date are dropped when either is given)
+        keep_book_uris: optional collection of book URIs; keep only events for these books
+    Output:
+        event_idxs: array of event indices into the store's columns
+    '''
+    def select(self, event_types, start_date=None, end_date=None, keep_book_uris=None):
+        event_idxs = self.events_of_types(event_types)
+        mask = np.ones(len(event_idxs), dtype=bool)
+        if start_date is not None:
+            mask &= self.start_dates[event_idxs] >= np.datetime64(start_date, 'D')
+        if end_date is not None:
+            mask &= self.start_dates[event_idxs] < np.datetime64(end_date, 'D')
+        if keep_book_uris is not None:
+            keep_books = np.zeros(len(self.book_uris) + 1, dtype=bool)
+            keep_books[[self.book_uri_to_index[uri] for uri in keep_book_uris if uri in self.book_uri_to_index]] = True
+            # book_index of -1 looks up the extra False at the end
+            mask &= keep_books[self.book_index[event_idxs]]
+        return event_idxs[mask]
+
+    '''
+    Get one (member, book) pair for every member of every selected event.
+
+    Input:
+        event_idxs: event indices, e.g. from select
+    Output:
+        member_indices: array of member indices
+        book_indices: array of book indices, aligned with member_indices
+    '''
+    def member_book_pairs(self, event_idxs):
+        num_members = self.member_indptr[event_idxs + 1] - self.member_indptr[event_idxs]
+        member_indices = self.member_indices[self.expand_ranges(self.member_indptr[event_idxs], num_members)]
+        return member_indices, np.repeat(self.book_index[event_idxs], num_members)
+
+    '''
+    Map members to the books that they borrowed.
+
+    Input:
+        keep_book_uris: optional collection of book URIs; ignore the books not in it
+        start_date, end_date: optional date range, as in select
+    Output:
+        borrower_to_books: dict from member URI to the set of URIs of the books that they borrowed
+    '''
+    def get_borrower_to_books(self, keep_book_uris=None, start_date=None, end_date=None):
+        event_idxs = self.select(['Borrow'], start_date, end_date, keep_book_uris)
+        # borrows without a book have book_index -1, which would otherwise look up the last book
+        event_idxs = event_idxs[self.book_index[event_idxs] >= 0]
+        member_indices, book_indices = self.member_book_pairs(event_idxs)
+        borrower_to_books = defaultdict(set)
+        for member_idx, book_idx in zip(member_indices.tolist(), book_indices.tolist()):
+            borrower_to_books[self.member_uris[member_idx]].add(self.book_uris[book_idx])
+        return borrower_to_books
+
+    '''
+    Count the events per book.
+
+    Input:
+        event_types: event type names to count (by default borrows and purchases)
+        start_date, end_date: optional date range, as in select
+    Output:
+        book_to_num_events: defaultdict from book URI to number of events
+    '''
+    def count_events_per_book(self, event_types=('Borrow', 'Purchase'), start_date=None, end_date=None):
+        event_idxs = self.select(event_types, start_date, end_date)
+        book_indices = self.book_index[event_idxs]
+        counts = np.bincount(book_indices[book_indices >= 0], minlength=len(self.book_uris))
+        book_to_num_events = defaultdict(int)
+        for book_idx in np.flatnonzero(counts).tolist():
+            book_to_num_events[self.book_uris[book_idx]] = int(counts[book_idx])
+        return book_to_num_events
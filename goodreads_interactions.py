@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+import json
+from collections.abc import Mapping
+
+# number of interactions read from the raw file at a time
+interactions_chunk_size = 1 << 20
+
+'''
+Compact map from people to the books they interacted with, stored as integer arrays with offsets
+(the same layout as the rows of a CSR matrix), so millions of interactions take a few bytes each.
+It is a read-only Mapping from user ID to the list of book IDs of that user, so it can be used
+anywhere a person_to_books dict is expected; get_reader_book_incidence uses the arrays directly.
+
+    user_ids: list of user IDs; user i is row i
+    book_ids: sorted list of book IDs; indices refer to positions in this list
+    indptr, indices: the books of user i are book_ids[indices[indptr[i]:indptr[i+1]]],
+                     without repeats and in increasing order
+'''
+class ReaderBooks(Mapping):
+    def __init__(self, user_ids, book_ids, indptr, indices):
+        self.user_ids = list(user_ids)
+        self.book_ids = list(book_ids)
+        self.indptr = indptr
+        self.indices = indices
+        self.user_id_to_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+
+    def __getitem__(self, user_id):
+        i = self.user_id_to_index[user_id]
+        return [self.book_ids[b] for b in self.indices[self.indptr[i]:self.indptr[i+1]].tolist()]
+
+    def __iter__(self):
+        return iter(self.user_ids)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    # total number of (user, book) interactions
+    @property
+    def num_interactions(self):
+        return len(self.indices)
+
+    '''
+    Build the structure from one (user, book) pair per interaction, in any order and with repeats.
+
+    Input:
+        user_ids: list of user IDs; user_codes refer to positions in this list
+        book_ids: sorted list of book IDs; book_codes refer to positions in this list
+        user_codes, book_codes: integer arrays with the user and the book of every interaction
+    Output:
+        reader_books: ReaderBooks with the users that have at least one interaction, in the order of user_ids
+    '''
+    @classmethod
+    def from_pairs(cls, user_ids, book_ids, user_codes, book_codes):
+        num_books = max(len(book_ids), 1)
+        pairs = np.unique(np.asarray(user_codes, dtype=np.int64) * num_books + np.asarray(book_codes, dtype=np.int64))
+        users, indices = np.divmod(pairs, num_books)
+        # drop the users without interactions and renumber the others
+        present = np.unique(users)
+        counts = np.bincount(np.searchsorted(present, users), minlength=len(present))
+        indptr = np.zeros(len(present) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls([user_ids[u] for u in present.tolist()], book_ids, indptr, indices.astype(np.int32))
+
+    def save(self, path):
+        np.savez(path, user_ids=np.array(self.user_ids, dtype=str), book_ids=np.array(self.book_ids, dtype=str),
+                 indptr=self.indptr, indices=self.indices)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['user_ids'].tolist(), f['book_ids'].tolist(), f['indptr'], f['indices'])
+
+    # save as JSON in the format of data/goodreads-user-to-books.json
+    def save_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({user_id: self[user_id] for user_id in self.user_ids}, f)
+
+'''
+Read the Goodreads book ID map of the UCSD dataset, which maps the book IDs used in
+goodreads_interactions.csv to the Goodreads book IDs.
+
+Input:
+    path: path of book_id_map.csv, with columns book_id_csv and book_id
+Output:
+    csv_to_book_id: integer array; csv_to_book_id[i] is the Goodreads book ID of CSV book ID i (-1 if unused)
+'''
+def load_book_id_map(path):
+    book_id_map = pd.read_csv(path, usecols=['book_id_csv', 'book_id'], dtype=np.int64)
+    csv_to_book_id = np.full(book_id_map['book_id_csv'].max() + 1, -1, dtype=np.int64)
+    csv_to_book_id[book_id_map['book_id_csv'].to_numpy()] = book_id_map['book_id'].to_numpy()
+    return csv_to_book_id
+
+'''
+Iterate over a raw interactions file in chunks of rows.
+CSV files (goodreads_interactions.csv) and JSON lines files (goodreads_interactions_dedup.json)
+are supported, optionally compressed; the format and compression are taken from the file name.
+
+Input:
+    path: path of the interactions file
+    columns: names of the columns to read
+    chunk_size: number of rows per chunk
+Output:
+    generator of pandas DataFrames with the given columns
+'''
+def iter_interaction_chunks(path, columns, chunk_size=interactions_chunk_size):
+    name = path[:-len('.gz')] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        # user IDs are kept as strings, like the keys of goodreads-user-to-books.json
+        reader = pd.read_csv(path, usecols=columns, dtype={'user_id': str}, chunksize=chunk_size)
+    elif name.endswith('.json') or name.endswith('.jsonl'):
+        reader = pd.read_json(path, lines=True, dtype=False, chunksize=chunk_size)
+    else:
+        raise ValueError('unknown interactions file format: {}'.format(path))
+    with reader:
+        for chunk in reader:
+            yield chunk[columns]
+
+'''
+Stream a raw UCSD Goodreads interactions file and keep the interactions with the given books.
+Only one chunk of the file and the kept interactions are in memory at any time,
+so dumps with hundreds of millions of interactions can be read on a single machine.
+
+Input:
+    path: path of goodreads_interactions.csv or goodreads_interactions_dedup.json (optionally .gz)
+    keep_book_ids: collection of Goodreads book IDs (as strings) to keep,
+                   e.g. the keys of data/goodreads-book-id-to-sc-uri.json
+    book_id_map_path: path of book_id_map.csv, needed for the CSV file, whose book IDs are renumbered
+    min_rating: optional minimum rating (1-5) of the interactions to keep; unrated interactions have rating 0
+    require_read: only keep the interactions marked as read
+    chunk_size: number of rows to read at a time
+Output:
+    reader_books: ReaderBooks of the users with at least one kept interaction, in order of first appearance
+'''
+def ingest_goodreads_interactions(path, keep_book_ids, book_id_map_path=None, min_rating=None, require_read=False,
+                                  chunk_size=interactions_chunk_size):
+    book_ids = sorted(set(keep_book_ids))
+    # kept Goodreads book IDs in numeric order, and the position of each one in book_ids
+    numeric_ids = np.array([int(book_id) for book_id in book_ids], dtype=np.int64)
+    numeric_order = np.argsort(numeric_ids)
+    sorted_ids = numeric_ids[numeric_order]
+    csv_to_book_id = None if book_id_map_path is None else load_book_id_map(book_id_map_path)
+
+    columns = ['user_id', 'book_id']
+    if min_rating is not None:
+        columns.append('rating')
+    if require_read:
+        columns.append('is_read')
+    user_id_to_code = {}
+    user_codes = []
+    book_codes = []
+    for chunk in iter_interaction_chunks(path, columns, chunk_size):
+        goodreads_ids = chunk['book_id'].to_numpy().astype(np.int64)
+        if csv_to_book_id is not None:
+            goodreads_ids = csv_to_book_id[goodreads_ids]
+        positions = np.minimum(np.searchsorted(sorted_ids, goodreads_ids), len(sorted_ids) - 1)
+        mask = sorted_ids[positions] == goodreads_ids
+        if min_rating is not None:
+            mask &= chunk['rating'].to_numpy().astype(np.int64) >= min_rating
+        if require_read:
+            mask &= chunk['is_read'].to_numpy().astype(bool)
+        if not mask.any():
+            continue
+        users = chunk['user_id'].to_numpy()[mask]
+        user_codes.append(np.fromiter((user_id_to_code.setdefault(str(u), len(user_id_to_code)) for u in users),
+                                      dtype=np.int64, count=len(users)))
+        book_codes.append(numeric_order[positions[mask]])
+
+    user_ids = [None] * len(user_id_to_code)
+    for user_id, code in user_id_to_code.items():
+        user_ids[code] = user_id
+    if len(user_codes) == 0:
+        return ReaderBooks([], book_ids, np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+    return ReaderBooks.from_pairs(user_ids, book_ids, np.concatenate(user_codes), np.concatenate(book_codes))
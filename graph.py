@@ -1,11 +1,340 @@
 import numpy as np
+import scipy.sparse
 import networkx as nx
 import json
 import csv
-from collections import defaultdict, OrderedDict
+from collections import defaultdict
+from collections.abc import Mapping
 import itertools
-import operator
-import math
+import os
+import hashlib
+import shutil
+import functools
+import multiprocessing
+import abc
+from event_store import EventStore
+from goodreads_interactions import ReaderBooks
+
+'''
+A compact undirected graph stored in compressed sparse row (CSR) order.
+Since the graph is undirected, both (u, v) and (v, u) are stored.
+The neighbors of vertex u are indices[indptr[u]:indptr[u+1]], sorted in increasing order,
+and the matching edge weights are weights[indptr[u]:indptr[u+1]].
+Edges are therefore in a consistent order: by source vertex, then by target vertex.
+
+The dict formats used by earlier versions of this code are still available
+as lazy read-only views: graph.edge_to_weight and graph.vertex_to_neighbors.
+
+Input:
+    indptr: array of length n + 1, where row u spans indptr[u] to indptr[u+1]
+    indices: array of neighboring vertex indices, sorted within each row
+    weights: array of edge weights aligned with indices
+'''
+class BookGraph:
+    def __init__(self, indptr, indices, weights):
+        self.indptr = np.asarray(indptr)
+        self.indices = np.asarray(indices)
+        self.weights = np.asarray(weights)
+        self.n = len(self.indptr) - 1
+        self._sources = None
+
+    # number of directed edges, i.e. twice the number of unique undirected edges
+    @property
+    def m(self):
+        return len(self.indices)
+
+    # source vertex of every edge, aligned with indices and weights
+    @property
+    def sources(self):
+        if self._sources is None:
+            self._sources = np.repeat(np.arange(self.n, dtype=self.indices.dtype), np.diff(self.indptr))
+        return self._sources
+
+    def neighbors(self, u):
+        return self.indices[self.indptr[u]:self.indptr[u+1]]
+
+    def neighbor_weights(self, u):
+        return self.weights[self.indptr[u]:self.indptr[u+1]]
+
+    # number of neighbors of each vertex
+    def num_neighbors(self):
+        return np.diff(self.indptr)
+
+    # sum of incident edge weights for each vertex
+    def degrees(self):
+        return self.row_sums(self.weights)
+
+    # segmented sum of per-edge values (aligned with indices) over the rows of each vertex
+    # values can be 1-d (one value per edge) or 2-d (one row of values per edge)
+    def row_sums(self, values):
+        sums = np.zeros((self.n,) + values.shape[1:], dtype=values.dtype)
+        nonempty = self.indptr[:-1] < self.indptr[1:]
+        if np.any(nonempty):
+            sums[nonempty] = np.add.reduceat(values, self.indptr[:-1][nonempty], axis=0)
+        return sums
+
+    '''
+    Split the vertices into consecutive ranges of rows with at most max_edges edges each
+    (a single row with more edges gets a range of its own), for passes over the edges one block at a time.
+    Together with block_edges, a pass only ever holds one block of the edge arrays in memory,
+    so graphs whose arrays are memory-mapped (see load_graph) are streamed from disk.
+
+    Input:
+        max_edges: maximum number of edges per block (default: edge_block_size)
+    Output:
+        generator of (row_start, row_end) pairs; the block spans the vertices row_start to row_end - 1
+    '''
+    def row_blocks(self, max_edges=None):
+        if max_edges is None:
+            max_edges = edge_block_size
+        row_start = 0
+        while row_start < self.n:
+            row_end = int(np.searchsorted(self.indptr, self.indptr[row_start] + max_edges, side='right')) - 1
+            row_end = min(max(row_end, row_start + 1), self.n)
+            yield row_start, row_end
+            row_start = row_end
+
+    # sources, targets and weights of the edges in the rows row_start to row_end - 1, as in-memory arrays
+    def block_edges(self, row_start, row_end):
+        edge_start, edge_end = self.indptr[row_start], self.indptr[row_end]
+        sources = np.repeat(np.arange(row_start, row_end, dtype=self.indices.dtype), np.diff(self.indptr[row_start:row_end+1]))
+        return sources, np.array(self.indices[edge_start:edge_end]), np.array(self.weights[edge_start:edge_end])
+
+    # for every edge (u, v), the index of the edge (v, u) in CSR order
+    def reverse_edges(self):
+        # sorting the edges by (target, source) lists the reverse of each edge in CSR order
+        return np.lexsort((self.sources, self.indices))
+
+    # index of edge (u, v) in CSR order, or -1 if there is no such edge
+    def edge_index(self, u, v):
+        row = self.neighbors(u)
+        pos = np.searchsorted(row, v)
+        if pos < len(row) and row[pos] == v:
+            return self.indptr[u] + pos
+        return -1
+
+    '''
+    Get the weighted adjacency rows of some vertices as a sparse matrix,
+    optionally with the columns relabeled, e.g. into an order shared with another graph.
+
+    Input:
+        vertices: array of vertex indices, one per output row
+        column_index: optional array from vertex index to output column;
+                      neighbors with a negative column are left out
+        num_columns: number of output columns (default: n)
+    Output:
+        rows: scipy.sparse.csr_matrix of shape (len(vertices), num_columns)
+    '''
+    def adjacency_rows(self, vertices, column_index=None, num_columns=None):
+        rows = scipy.sparse.csr_matrix((self.weights, self.indices, self.indptr), shape=(self.n, self.n))[np.asarray(vertices)]
+        if column_index is None:
+            return rows
+        columns = np.asarray(column_index)[rows.indices]
+        row_of_entry = np.repeat(np.arange(rows.shape[0]), np.diff(rows.indptr))
+        keep = columns >= 0
+        return scipy.sparse.csr_matrix((rows.data[keep], (row_of_entry[keep], columns[keep])),
+                                       shape=(rows.shape[0], self.n if num_columns is None else num_columns))
+
+    @property
+    def edge_to_weight(self):
+        return EdgeToWeightView(self)
+
+    @property
+    def vertex_to_neighbors(self):
+        return VertexToNeighborsView(self)
+
+    '''
+    Build a graph from parallel arrays of directed edges.
+    Edges can be in any order, and repeated edges have their weights summed.
+    The caller is responsible for including both (u, v) and (v, u).
+
+    Input:
+        sources: array of source vertex indices
+        targets: array of target vertex indices
+        weights: array of edge weights
+        n: number of vertices in the graph
+    Output:
+        graph: BookGraph with the edges in CSR order
+    '''
+    @classmethod
+    def from_edges(cls, sources, targets, weights, n):
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        weights = np.asarray(weights)
+        # sort by (source, target) and sum the weights of repeated edges
+        keys = sources * n + targets
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        is_first = np.ones(len(keys), dtype=bool)
+        is_first[1:] = keys[1:] != keys[:-1]
+        starts = np.flatnonzero(is_first)
+        if len(starts) > 0:
+            weights = np.add.reduceat(weights[order], starts)
+        else:
+            weights = weights[order]
+        keys = keys[starts]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n, minlength=n), out=indptr[1:])
+        indices = (keys % n).astype(np.int32)
+        return cls(indptr, indices, weights)
+
+'''
+Read-only view of per-edge values as a dict from vertex index pair (u, v) to value.
+Keys are in CSR order, so iterating matches the sorted edge order of the graph.
+
+Input:
+    graph: BookGraph
+    values: array of per-edge values aligned with graph.indices
+'''
+class EdgeValuesView(Mapping):
+    def __init__(self, graph, values):
+        self._graph = graph
+        self._values = values
+
+    def __getitem__(self, edge):
+        u, v = edge
+        if not 0 <= u < self._graph.n:
+            raise KeyError(edge)
+        idx = self._graph.edge_index(u, v)
+        if idx < 0:
+            raise KeyError(edge)
+        return self._values[idx].item()
+
+    def __iter__(self):
+        return zip(self._graph.sources.tolist(), self._graph.indices.tolist())
+
+    def __len__(self):
+        return self._graph.m
+
+    def values(self):
+        return self._values.tolist()
+
+    def items(self):
+        return zip(iter(self), self._values.tolist())
+
+'''
+Read-only view of a BookGraph as a dict from vertex index pair (u, v) to edge weight.
+'''
+class EdgeToWeightView(EdgeValuesView):
+    def __init__(self, graph):
+        super().__init__(graph, graph.weights)
+
+'''
+Read-only view of a BookGraph as a dict from vertex index to a sorted list of neighboring vertex indices.
+'''
+class VertexToNeighborsView(Mapping):
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, u):
+        if not 0 <= u < self._graph.n:
+            raise KeyError(u)
+        return self._graph.neighbors(u).tolist()
+
+    def __iter__(self):
+        return iter(range(self._graph.n))
+
+    def __len__(self):
+        return self._graph.n
+
+'''
+The strongest neighbors of every vertex, sorted by decreasing weight (ties by increasing vertex index),
+so that a top-k query is a slice instead of a sort over all neighbors.
+Stored like a BookGraph: the kept neighbors of u are indices[indptr[u]:indptr[u+1]]
+with weights weights[indptr[u]:indptr[u+1]], at most k of them.
+
+Input:
+    k: maximum number of neighbors kept per vertex
+    indptr, indices, weights: the kept neighbors in the layout above
+'''
+class NeighborIndex:
+    def __init__(self, k, indptr, indices, weights):
+        self.k = k
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+
+    '''
+    Build the index with one partial sort per row of the graph.
+
+    Input:
+        graph: BookGraph
+        k: maximum number of neighbors to keep per vertex
+        weights: optional edge weights to rank by instead of graph.weights, aligned with graph.indices
+                 (e.g. a different weighting from project_books_graph or align_edge_weights)
+    Output:
+        index: NeighborIndex
+    '''
+    @classmethod
+    def from_graph(cls, graph, k, weights=None):
+        if weights is None:
+            weights = graph.weights
+        weights = np.asarray(weights)
+        kept_edges = []
+        for u in range(graph.n):
+            start, end = graph.indptr[u], graph.indptr[u+1]
+            row_weights = weights[start:end]
+            if end - start > k:
+                # k-th largest weight, then everything above it and the lowest-index ties at it
+                kth_weight = np.partition(row_weights, end - start - k)[end - start - k]
+                above = np.flatnonzero(row_weights > kth_weight)
+                ties = np.flatnonzero(row_weights == kth_weight)[:k - len(above)]
+                keep = np.concatenate([above, ties])
+            else:
+                keep = np.arange(end - start)
+            keep = keep[np.lexsort((graph.indices[start:end][keep], -row_weights[keep]))]
+            kept_edges.append(start + keep)
+        kept_edges = np.concatenate(kept_edges) if kept_edges else np.zeros(0, dtype=np.int64)
+        indptr = np.zeros(graph.n + 1, dtype=np.int64)
+        np.cumsum(np.minimum(graph.num_neighbors(), k), out=indptr[1:])
+        return cls(k, indptr, graph.indices[kept_edges], weights[kept_edges])
+
+    '''
+    Get the strongest neighbors of a vertex.
+
+    Input:
+        u: vertex index
+        k: number of neighbors to return, at most the index's k (default: all kept neighbors)
+    Output:
+        neighbors: array of up to k vertex indices, strongest first
+        weights: array of their edge weights
+    '''
+    def top(self, u, k=None):
+        if k is not None and k > self.k:
+            raise ValueError('index only keeps the top {} neighbors, but {} were requested'.format(self.k, k))
+        start = self.indptr[u]
+        end = self.indptr[u+1] if k is None else min(self.indptr[u+1], start + k)
+        return self.indices[start:end], self.weights[start:end]
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'indptr.npy'), self.indptr)
+        np.save(os.path.join(directory, 'indices.npy'), self.indices)
+        np.save(os.path.join(directory, 'weights.npy'), self.weights)
+
+    @classmethod
+    def load(cls, directory, k, mmap_mode=None):
+        return cls(k,
+                   np.load(os.path.join(directory, 'indptr.npy'), mmap_mode=mmap_mode),
+                   np.load(os.path.join(directory, 'indices.npy'), mmap_mode=mmap_mode),
+                   np.load(os.path.join(directory, 'weights.npy'), mmap_mode=mmap_mode))
+
+# built graphs are cached here, keyed by the contents of their input files and the builder used
+graph_cache_directory = 'cache'
+# bump this when the cached format or the graph construction changes, so old entries are ignored
+graph_cache_version = 2
+# number of neighbors per vertex kept by the neighbor index cached with each graph
+neighbor_index_k = 50
+# maximum number of edges per block in passes over the edges one block at a time (see BookGraph.row_blocks)
+edge_block_size = 1 << 22
+
+'''
+Paths of the three parts of the Shakespeare and Company dataset.
+'''
+def get_shakespeare_and_company_paths(folder):
+    return ['{}/SCoData_books_v1.1_2021_01.json'.format(folder),
+            '{}/SCoData_members_v1.1_2021_01.json'.format(folder),
+            '{}/SCoData_events_v1.1_2021_01.json'.format(folder)]
 
 '''
 Load the three parts of the Shakespeare and Company dataset.
@@ -15,17 +344,37 @@ Input:
 Output:
     books: dict from book URI to book data
     members: dict from member URI to member data
-    events: dict from event URI to event data
+    events: list of event data
 '''
 def load_shakespeare_and_company_data(folder):
-    with open('{}/SCoData_books_v1.1_2021_01.json'.format(folder), 'r') as f:
+    books_path, members_path, events_path = get_shakespeare_and_company_paths(folder)
+    with open(books_path, 'r') as f:
         books = {book['uri']: book for book in json.load(f)}
-    with open('{}/SCoData_members_v1.1_2021_01.json'.format(folder), 'r') as f:
+    with open(members_path, 'r') as f:
         members = {member['uri']: member for member in json.load(f)}
-    with open('{}/SCoData_events_v1.1_2021_01.json'.format(folder), 'r') as f:
+    with open(events_path, 'r') as f:
         events = json.load(f)
     return books, members, events
 
+'''
+Load the Shakespeare and Company dataset with the events in a columnar EventStore.
+Build the store once and run all event queries against it
+(borrower to books, popularity counts, date ranges, ...) instead of scanning the list of events each time.
+The events file is streamed into the store, so the full list of event dicts is never in memory,
+and the members file is not read at all (use load_shakespeare_and_company_data for the members).
+
+Input:
+    folder: directory that contains the Shakespeare and Company data
+Output:
+    books: dict from book URI to book data
+    store: EventStore of all events
+'''
+def load_shakespeare_and_company_store(folder):
+    books_path, members_path, events_path = get_shakespeare_and_company_paths(folder)
+    with open(books_path, 'r') as f:
+        books = {book['uri']: book for book in json.load(f)}
+    return books, EventStore.from_json_file(events_path)
+
 '''
 Summarize each book's information into one string: [title] by [author] ([year])
 
@@ -74,16 +423,44 @@ def map_book_uris_to_title(books):
         book_to_title[uri] = books[uri]['title']
     return book_to_title
 
+'''
+Get the summary string, year, title and author of every book in one pass over the books.
+
+Input:
+    books: dict from book URI to book data for Shakespeare and Company
+Output:
+    book_to_text, book_to_year, book_to_title, book_to_author:
+        the same dicts as map_book_uris_to_text, map_book_uris_to_year, map_book_uris_to_title and map_book_uris_to_author
+'''
+def map_book_uris_to_metadata(books):
+    book_to_text = {}
+    book_to_year = defaultdict(str)
+    book_to_title = defaultdict(str)
+    book_to_author = defaultdict(str)
+    for uri, book in books.items():
+        author = ''
+        year = ''
+        if 'author' in book:
+            book_to_author[uri] = ' & '.join(book['author'])
+            author = ' by {}'.format(book_to_author[uri])
+        if 'year' in book:
+            book_to_year[uri] = book['year']
+            year = ' ({})'.format(book['year'])
+        book_to_title[uri] = book['title']
+        book_to_text[uri] = '{}{}{}'.format(book['title'], author, year)
+    return book_to_text, book_to_year, book_to_title, book_to_author
+
 '''
 Save a CSV file in Gephi format--Gephi is an extremely clunky but useful graph visualization program.
 
 Input:
-    edge_to_weight: dict from vertex index pair (u, v) to number of times book u and book v were interacted with by the same person
+    graph: BookGraph of the books
     books_in_vertex_order: list of book names in order
     dataset: dataset name for saving the file
-    C: dict from edge to most likely community for that edge
+    C: most likely community of each edge, as an array in edge order (or a dict from edge to community)
 '''
-def export_to_gephi(edge_to_weight, books_in_vertex_order, dataset, C):
+def export_to_gephi(graph, books_in_vertex_order, dataset, C):
+    edge_communities = get_edge_communities_array(graph, C)
     print('Exporting {} to gephi!'.format(dataset))
     with open('./gephi-{}.gdf'.format(dataset), 'w') as csvfile:
         csvwriter = csv.writer(csvfile, delimiter=',')
@@ -95,11 +472,13 @@ def export_to_gephi(edge_to_weight, books_in_vertex_order, dataset, C):
         # now write the edges, each with their most likely community
         # so that in Gephi we can give each community a different color
         csvwriter.writerow(['edgedef>node1 VARCHAR', 'node2 VARCHAR', 'group VARCHAR'])
-        for (u, v) in edge_to_weight.keys():
-            # each edge is in twice: (u,v) and (v,u), so only print the edge once, when u < v
-            if v < u:
-                continue
-            csvwriter.writerow([u, v, C[(u,v)]])
+        # each edge is in twice: (u,v) and (v,u), so only print the edge once, when u < v
+        # the edges are written one block at a time, so memory-mapped graphs are streamed
+        for row_start, row_end in graph.row_blocks():
+            sources, targets, _ = graph.block_edges(row_start, row_end)
+            communities = edge_communities[graph.indptr[row_start]:graph.indptr[row_end]]
+            upper = sources < targets
+            csvwriter.writerows(zip(sources[upper].tolist(), targets[upper].tolist(), communities[upper].tolist()))
 
 '''
 Find all the books in Shakespeare and Company that:
@@ -109,23 +488,347 @@ and map members to these books that they borrowed.
 
 Input:
     books: dict from book URI to book data for Shakespeare and Company
-    events: dict from event URI to event data for Shakespeare and Company
+    events: EventStore, or list of event data for Shakespeare and Company
     keep_uris: set of book URIs that also occur in the Goodreads dataset. ignore the books not in this set
 Output:
     borrower_to_books: dict from member URI to the URIs of the books that they borrowed
 '''
 def internal_get_sc_borrower_to_books(books, events, keep_uris):
-    borrower_to_books = defaultdict(set)
-    for event in events:
-        if event['event_type'] != 'Borrow':
-            continue
-        book_uri = event['item']['uri']
-        # skip this book if it's not also in goodreads
-        if book_uri not in keep_uris:
-            continue
-        for member_uri in event['member']['uris']:
-            borrower_to_books[member_uri].add(book_uri)
-    return borrower_to_books
+    if not isinstance(events, EventStore):
+        events = EventStore.from_events(events)
+    return events.get_borrower_to_books(keep_uris)
+
+'''
+Build the sparse reader x book incidence matrix.
+
+Input:
+    person_to_books: dict from member URI (or user ID) to all the books that person interacted with,
+                     or a ReaderBooks, whose arrays are used as they are
+Output:
+    books_in_vertex_order: sorted list of the books that have at least one edge, i.e. that share a person with another book
+    incidence: scipy.sparse CSR matrix (people x books) with a 1 where the person interacted with the book
+    readers_per_book: number of people who interacted with each book, including people with only one book
+'''
+def get_reader_book_incidence(person_to_books):
+    if isinstance(person_to_books, ReaderBooks):
+        books = np.array(person_to_books.book_ids)
+        columns = person_to_books.indices
+        num_books_per_reader = np.diff(person_to_books.indptr)
+        if len(columns) == 0:
+            return [], scipy.sparse.csr_matrix((0, 0), dtype=np.int64), np.zeros(0, dtype=np.int64)
+        incidence = scipy.sparse.csr_matrix((np.ones(len(columns), dtype=np.int64), columns, person_to_books.indptr),
+                                            shape=(len(num_books_per_reader), len(books)))
+    else:
+        # repeated books in one person's list only count once
+        readers_books = [set(books) for books in person_to_books.values() if len(books) > 0]
+        num_books_per_reader = np.fromiter((len(books) for books in readers_books), dtype=np.int64, count=len(readers_books))
+        all_books = np.array(list(itertools.chain.from_iterable(readers_books)))
+        if len(all_books) == 0:
+            return [], scipy.sparse.csr_matrix((0, 0), dtype=np.int64), np.zeros(0, dtype=np.int64)
+        books, columns = np.unique(all_books, return_inverse=True)
+        rows = np.repeat(np.arange(len(readers_books)), num_books_per_reader)
+        incidence = scipy.sparse.csr_matrix((np.ones(len(columns), dtype=np.int64), (rows, columns)),
+                                            shape=(len(readers_books), len(books)))
+    readers_per_book = np.bincount(columns, minlength=len(books))
+    # books that only people with one book interacted with have no edges, so they are not vertices
+    connected = np.zeros(len(books), dtype=bool)
+    connected[columns[np.repeat(num_books_per_reader >= 2, num_books_per_reader)]] = True
+    incidence = scipy.sparse.csr_matrix(incidence[:, connected])
+    return books[connected].tolist(), incidence, readers_per_book[connected]
+
+'''
+Project a reader x book incidence matrix onto the books: the weight of edge (u, v) is
+the sum over the people who interacted with both u and v of that person's weight,
+i.e. the off-diagonal part of incidence^T * diag(reader_weights) * incidence.
+
+With num_workers, the people of large incidence matrices are split into shards that are projected in parallel
+(see project_incidence_sharded); the graph has the same edges, and the same weights up to rounding.
+
+Input:
+    incidence: scipy.sparse CSR matrix (people x books), from get_reader_book_incidence
+    reader_weights: optional array with one weight per person (row of incidence); every person counts once by default
+    num_workers: optional number of worker processes
+Output:
+    graph: BookGraph of the books
+'''
+def project_incidence(incidence, reader_weights=None, num_workers=None):
+    if num_workers is not None and num_workers > 1:
+        return project_incidence_sharded(incidence, reader_weights, num_workers)
+    weighted_incidence = incidence
+    if reader_weights is not None:
+        weighted_incidence = scipy.sparse.diags(reader_weights) @ incidence
+    cooccurrence = scipy.sparse.csr_matrix(incidence.T @ weighted_incidence)
+    cooccurrence.eliminate_zeros()
+    cooccurrence.sort_indices()
+    # a book does not have an edge to itself, so drop the diagonal
+    n = cooccurrence.shape[0]
+    rows = np.repeat(np.arange(n), np.diff(cooccurrence.indptr))
+    off_diagonal = rows != cooccurrence.indices
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows[off_diagonal], minlength=n), out=indptr[1:])
+    return BookGraph(indptr, cooccurrence.indices[off_diagonal].astype(np.int32), cooccurrence.data[off_diagonal])
+
+# projections with fewer book pairs than this (the sum over people of their number of books squared)
+# take less time in one process than it takes to start a pool of workers, so they are not sharded
+min_sharded_pairs = 1 << 25
+
+'''
+Split the people of an incidence matrix into contiguous shards with about the same number of book pairs,
+leaving out the people with fewer than two books, who add nothing to the projection.
+
+Input:
+    incidence: scipy.sparse CSR matrix (people x books)
+    num_shards: number of shards
+Output:
+    shards: list of arrays of row indices, one per non-empty shard
+'''
+def split_incidence_rows(incidence, num_shards):
+    num_books_per_reader = np.diff(incidence.indptr)
+    rows = np.flatnonzero(num_books_per_reader >= 2)
+    if len(rows) == 0:
+        return []
+    # the work for a person with k books is about k^2
+    work = np.cumsum(num_books_per_reader[rows].astype(np.float64) ** 2)
+    bounds = np.searchsorted(work, work[-1] * np.arange(1, num_shards) / num_shards, side='right')
+    return [shard for shard in np.split(rows, bounds) if len(shard) > 0]
+
+'''
+Project one shard of people onto the books (run in a worker process by project_incidence_sharded).
+
+Input:
+    args: tuple of the incidence rows of the shard (scipy.sparse CSR matrix) and their reader weights (or None)
+Output:
+    indptr, indices, weights: CSR arrays of the projection of the shard
+'''
+def project_incidence_shard(args):
+    incidence, reader_weights = args
+    graph = project_incidence(incidence, reader_weights)
+    return graph.indptr, graph.indices, graph.weights
+
+'''
+Project a reader x book incidence matrix onto the books like project_incidence,
+splitting the people into one shard per worker process, with about the same number of book pairs each.
+People are independent, so the projection is the sum of the projections of the shards.
+Each shard's projection is added to a running sum as soon as it is done, so apart from the sum
+only the projections of shards that are still being added are held at once. The weights of an edge
+are summed in the order that the shards finish, so non-integer weights can differ in the last bits between runs.
+The vertices are the columns of incidence, so the vertex order does not depend on the sharding.
+Projections with fewer than min_pairs book pairs are computed in this process instead.
+
+Input:
+    incidence: scipy.sparse CSR matrix (people x books), from get_reader_book_incidence
+    reader_weights: optional array with one weight per person (row of incidence)
+    num_workers: number of worker processes and shards (the number of CPUs by default)
+    min_pairs: smallest number of book pairs to shard (default: min_sharded_pairs)
+Output:
+    graph: BookGraph of the books
+'''
+def project_incidence_sharded(incidence, reader_weights=None, num_workers=None, min_pairs=None):
+    num_workers = num_workers or os.cpu_count()
+    if min_pairs is None:
+        min_pairs = min_sharded_pairs
+    incidence = scipy.sparse.csr_matrix(incidence)
+    num_pairs = np.sum(np.diff(incidence.indptr).astype(np.float64) ** 2)
+    shards = split_incidence_rows(incidence, num_workers) if num_pairs >= min_pairs else []
+    if len(shards) < 2:
+        return project_incidence(incidence, reader_weights)
+    n = incidence.shape[1]
+    total = None
+    shard_args = ((incidence[rows], None if reader_weights is None else reader_weights[rows]) for rows in shards)
+    with multiprocessing.Pool(len(shards)) as pool:
+        for indptr, indices, weights in pool.imap_unordered(project_incidence_shard, shard_args):
+            partial = scipy.sparse.csr_matrix((weights, indices, indptr), shape=(n, n))
+            total = partial if total is None else total + partial
+    # the projections of the shards have no diagonal, so neither does their sum
+    total.sort_indices()
+    return BookGraph(total.indptr.astype(np.int64), total.indices.astype(np.int32), total.data)
+
+'''
+Project a reader x book incidence matrix onto the books like project_incidence,
+but write the graph to a directory in the format of save_graph, one block of rows at a time,
+so the graph never has to fit in memory. A block of rows of the projection only needs
+the incidence rows of its books, and the number of edges in a block is bounded by
+the sum over its books' readers of their numbers of books.
+
+Input:
+    incidence: scipy.sparse CSR matrix (people x books), from get_reader_book_incidence
+    directory: directory to write indptr.npy, indices.npy and weights.npy to
+    reader_weights: optional array with one weight per person (row of incidence)
+    max_edges: maximum number of edges per block (default: edge_block_size)
+'''
+def project_incidence_to_disk(incidence, directory, reader_weights=None, max_edges=None):
+    if max_edges is None:
+        max_edges = edge_block_size
+    os.makedirs(directory, exist_ok=True)
+    n = incidence.shape[1]
+    weighted_incidence = incidence
+    if reader_weights is not None:
+        weighted_incidence = scipy.sparse.diags(reader_weights) @ incidence
+    # books x people, so the books of a block are a slice of rows
+    books_by_readers = scipy.sparse.csr_matrix(incidence.T)
+    # upper bound on the number of edges in each book's row
+    max_row_edges = books_by_readers @ np.diff(incidence.indptr)
+    block_starts = [0]
+    cumulative_edges = np.cumsum(max_row_edges)
+    while block_starts[-1] < n:
+        offset = cumulative_edges[block_starts[-1] - 1] if block_starts[-1] > 0 else 0
+        block_end = int(np.searchsorted(cumulative_edges, offset + max_edges, side='right'))
+        block_starts.append(min(max(block_end, block_starts[-1] + 1), n))
+
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    raw_paths = {name: os.path.join(directory, '{}.raw'.format(name)) for name in ['indices', 'weights']}
+    dtypes = {'indices': np.dtype(np.int32), 'weights': np.dtype(weighted_incidence.dtype)}
+    with open(raw_paths['indices'], 'wb') as indices_file, open(raw_paths['weights'], 'wb') as weights_file:
+        for row_start, row_end in zip(block_starts[:-1], block_starts[1:]):
+            block = scipy.sparse.csr_matrix(books_by_readers[row_start:row_end] @ weighted_incidence)
+            block.eliminate_zeros()
+            block.sort_indices()
+            # a book does not have an edge to itself, so drop the diagonal
+            rows = np.repeat(np.arange(row_start, row_end), np.diff(block.indptr))
+            off_diagonal = rows != block.indices
+            indptr[row_start+1:row_end+1] = indptr[row_start] + np.cumsum(np.bincount(rows[off_diagonal] - row_start, minlength=row_end - row_start))
+            block.indices[off_diagonal].astype(dtypes['indices']).tofile(indices_file)
+            block.data[off_diagonal].astype(dtypes['weights']).tofile(weights_file)
+    np.save(os.path.join(directory, 'indptr.npy'), indptr)
+    # np.save copies the memory-mapped raw files sequentially, without reading them into memory
+    for name, raw_path in raw_paths.items():
+        if indptr[-1] > 0:
+            values = np.memmap(raw_path, dtype=dtypes[name], mode='r', shape=(int(indptr[-1]),))
+        else:
+            values = np.zeros(0, dtype=dtypes[name])
+        np.save(os.path.join(directory, '{}.npy'.format(name)), values)
+        del values
+        os.remove(raw_path)
+
+'''
+Construct a books graph like create_books_graph (or another reader weighting of project_books_graph),
+writing it to a directory one block at a time (see project_incidence_to_disk) instead of building it in memory.
+The graph is returned memory-mapped, so it can be larger than memory.
+
+Input:
+    person_to_books: dict from member URI (or user ID) to all the books that person interacted with
+    directory: directory to save the graph to, in the format of save_graph
+    weighting: name of a reader weighting in edge_weightings
+Output:
+    books_in_vertex_order: list of book names in vertex order (sorted, so the order is fixed)
+    book_to_vertex_index: dict from book name to vertex index
+    graph: BookGraph whose arrays are memory-mapped from directory
+'''
+def build_books_graph_on_disk(person_to_books, directory, weighting='count'):
+    kind, reader_weighting = edge_weightings[weighting]
+    if kind != 'reader':
+        raise ValueError('only reader weightings can be built on disk, not {}'.format(weighting))
+    books_in_vertex_order, incidence, _ = get_reader_book_incidence(person_to_books)
+    # 'count' keeps the integer counts of project_books_graph
+    reader_weights = None if weighting == 'count' else reader_weighting(np.diff(incidence.indptr))
+    project_incidence_to_disk(incidence, directory, reader_weights)
+    with open(os.path.join(directory, 'labels.json'), 'w') as f:
+        json.dump(books_in_vertex_order, f)
+    _, graph = load_graph(directory, mmap_mode='r')
+    book_to_vertex_index = {v: i for i, v in enumerate(books_in_vertex_order)}
+    return books_in_vertex_order, book_to_vertex_index, graph
+
+# Edge weightings for the book projection.
+# A reader weighting gives each person a weight from the number of books they interacted with,
+# and an edge's weight is the sum of the weights of the people who interacted with both books.
+# A co-occurrence weighting is computed from the co-occurrence counts of each edge
+# and the number of people who interacted with each book.
+
+# every person counts once: the number of people who interacted with both books
+def count_reader_weights(num_books_per_reader):
+    return np.ones(len(num_books_per_reader))
+
+# each person's contribution to edge weights sums to 1: 1 / (k choose 2) for a person with k books
+def per_user_reader_weights(num_books_per_reader):
+    pairs = num_books_per_reader * (num_books_per_reader - 1) / 2
+    return np.divide(1.0, pairs, out=np.zeros(len(pairs)), where=pairs > 0)
+
+# Adamic-Adar: down-weight prolific readers by 1 / log(k)
+def adamic_adar_reader_weights(num_books_per_reader):
+    log_num_books = np.log(num_books_per_reader, dtype=np.float64)
+    return np.divide(1.0, log_num_books, out=np.zeros(len(log_num_books)), where=num_books_per_reader >= 2)
+
+# Jaccard similarity of the sets of people who interacted with each book
+def jaccard_edge_weights(counts, readers_per_book, num_readers):
+    return counts.weights / (readers_per_book[counts.sources] + readers_per_book[counts.indices] - counts.weights)
+
+# cosine similarity of the books' incidence vectors
+def cosine_edge_weights(counts, readers_per_book, num_readers):
+    return counts.weights / np.sqrt(readers_per_book[counts.sources] * readers_per_book[counts.indices].astype(np.float64))
+
+# lift: how much more often two books share a person than expected from their popularity
+def lift_edge_weights(counts, readers_per_book, num_readers):
+    return counts.weights * num_readers / (readers_per_book[counts.sources] * readers_per_book[counts.indices].astype(np.float64))
+
+# name -> ('reader', function of the number of books per person)
+#      or ('cooccurrence', function of (counts graph, people per book, number of people))
+# add an entry here to make a new weighting available to project_books_graph
+edge_weightings = {
+    'count': ('reader', count_reader_weights),
+    'per_user': ('reader', per_user_reader_weights),
+    'adamic_adar': ('reader', adamic_adar_reader_weights),
+    'jaccard': ('cooccurrence', jaccard_edge_weights),
+    'cosine': ('cooccurrence', cosine_edge_weights),
+    'lift': ('cooccurrence', lift_edge_weights),
+}
+
+'''
+Construct the books graph with one or more edge weightings.
+The incidence matrix and the co-occurrence counts are computed once and shared by all weightings;
+each reader weighting other than 'count' needs one more sparse matrix product.
+All returned graphs have the same edges in the same order (the edges of the 'count' graph),
+and they share the same indptr and indices arrays.
+
+Input:
+    person_to_books: dict from member URI (or user ID) to all the books that person interacted with
+    weightings: names of weightings in edge_weightings
+    num_workers: optional number of worker processes for the projections (see project_incidence)
+Output:
+    books_in_vertex_order: list of book names in vertex order (sorted, so the order is fixed)
+    book_to_vertex_index: dict from book name to vertex index
+    graphs: dict from weighting name to BookGraph
+'''
+def project_books_graph(person_to_books, weightings=('count',), num_workers=None):
+    books_in_vertex_order, incidence, readers_per_book = get_reader_book_incidence(person_to_books)
+    book_to_vertex_index = {v: i for i, v in enumerate(books_in_vertex_order)}
+    num_books_per_reader = np.diff(incidence.indptr)
+    num_readers = incidence.shape[0]
+    counts = project_incidence(incidence, num_workers=num_workers)
+    graphs = {}
+    for name in weightings:
+        kind, weighting = edge_weightings[name]
+        if name == 'count':
+            weights = counts.weights
+        elif kind == 'reader':
+            weighted = project_incidence(incidence, weighting(num_books_per_reader), num_workers)
+            weights = align_edge_weights(counts, weighted)
+        else:
+            weights = weighting(counts, readers_per_book, num_readers)
+        graphs[name] = BookGraph(counts.indptr, counts.indices, weights)
+    return books_in_vertex_order, book_to_vertex_index, graphs
+
+'''
+Get the weights of a graph at the edges of another graph on the same vertices (0 where an edge is missing).
+
+Input:
+    pattern: BookGraph whose edges to use
+    graph: BookGraph to take the weights from
+Output:
+    weights: array of weights aligned with pattern's edges
+'''
+def align_edge_weights(pattern, graph):
+    if np.array_equal(graph.indptr, pattern.indptr) and np.array_equal(graph.indices, pattern.indices):
+        return graph.weights
+    weights = np.zeros(pattern.m, dtype=graph.weights.dtype)
+    if graph.m == 0:
+        return weights
+    # edges are in CSR order, so their (source, target) keys are sorted
+    pattern_keys = pattern.sources.astype(np.int64) * pattern.n + pattern.indices
+    graph_keys = graph.sources.astype(np.int64) * graph.n + graph.indices
+    positions = np.minimum(np.searchsorted(graph_keys, pattern_keys), graph.m - 1)
+    found = graph_keys[positions] == pattern_keys
+    weights[found] = graph.weights[positions[found]]
+    return weights
 
 '''
 Construct an undirected graph.
@@ -133,137 +836,216 @@ Vertices: books
 Edges: book u and book v are connected by an edge (u, v) if the same person interacted with both
        We are allowing multiple edges between books, one for each person in common
        Since the graph is undirected, both (u,v) and (v,u) are present.
+The edge weights are computed as a sparse matrix product of the reader x book incidence matrix with itself,
+so the pairs of books that each person interacted with are never listed one by one.
 
 Input:
     person_to_books: dict from member URI (or user ID) to all the books that person interacted with
                      assumes that this only contains books that lead to a connected graph
 Output:
-    books_in_vertex_order: list of book names in vertex order (the order is arbitrary but fixed)
+    books_in_vertex_order: list of book names in vertex order (sorted, so the order is fixed)
     book_to_vertex_index: dict from book name to vertex index
-    edge_to_weight: dict from vertex index pair (u, v) to number of times book u and book v were interacted with by the same person
-    vertex_to_neighbors: dict from vertex index to a list of all neighboring vertex indices
-    n: number of vertices in the graph
+    graph: BookGraph whose edge weights are the number of times book u and book v were interacted with by the same person
 '''
 def create_books_graph(person_to_books):
-    # first create an edge between all pairs of books borrowed/reviewed by the same person
-    # and get all the books that have at least one edge
-    connected_vertices = set()
-    E = []
-    for person, books in person_to_books.items():
-        for book_1, book_2 in itertools.combinations(books, 2):
-            connected_vertices.add(book_1)
-            connected_vertices.add(book_2)
-            E.append((book_1, book_2))
-    # in the constructed graph, each book is given an integer index
-    # this is to make the community detection code closer to the paper's code
-    books_in_vertex_order = list(connected_vertices)
-    book_to_vertex_index = {v: i for i, v in enumerate(books_in_vertex_order)}
-    n = len(books_in_vertex_order)
-    edge_to_weight_unsorted = defaultdict(int)
-    vertex_to_neighbors = defaultdict(set)
-    for book_uri_1, book_uri_2 in E:
-        l = book_to_vertex_index[book_uri_1]
-        r = book_to_vertex_index[book_uri_2]
-        edge_to_weight_unsorted[(l, r)] += 1
-        edge_to_weight_unsorted[(r, l)] += 1
-        vertex_to_neighbors[l].add(r)
-        vertex_to_neighbors[r].add(l)
-    # a consistent ordering is useful for the community detection code
-    # sort lists of neighbors
-    vertex_to_neighbors = {u: sorted(list(neighbors)) for u, neighbors in vertex_to_neighbors.items()}
-    # sort edges
-    edge_to_weight = OrderedDict()
-    for u, neighbors in vertex_to_neighbors.items():
-        for v in neighbors:
-            edge_to_weight[(u, v)] = edge_to_weight_unsorted[(u, v)]
-    return books_in_vertex_order, book_to_vertex_index, edge_to_weight, vertex_to_neighbors, n
-
+    books_in_vertex_order, book_to_vertex_index, graphs = project_books_graph(person_to_books, ['count'])
+    return books_in_vertex_order, book_to_vertex_index, graphs['count']
 
+'''
+Construct an undirected graph like create_books_graph,
+but each person's contribution to the edge weights sums to 1:
+a person who interacted with k books adds 1 / (k choose 2) to the weight of each pair of their books.
 
+Input:
+    person_to_books: dict from member URI (or user ID) to all the books that person interacted with
+Output:
+    books_in_vertex_order: list of book names in vertex order (sorted, so the order is fixed)
+    book_to_vertex_index: dict from book name to vertex index
+    graph: BookGraph whose edge weights are the summed per-person weights
+'''
 def create_books_graph_weighted_by_user(person_to_books):
-    # first create an edge between all pairs of books borrowed/reviewed by the same person
-    # and get all the books that have at least one edge
-    connected_vertices = set()
-    E = []
-    for person, books in person_to_books.items():
-        # users who only interacted with one book don't contribute any edges
-        if len(books) < 2:
-            continue
-        # each user's contribution to edge weights sums to 1
-        user_weight = 1.0 / math.comb(len(books), 2)
-        for book_1, book_2 in itertools.combinations(books, 2):
-            connected_vertices.add(book_1)
-            connected_vertices.add(book_2)
-            E.append((book_1, book_2, user_weight))
-    # in the constructed graph, each book is given an integer index
-    # this is to make the community detection code closer to the paper's code
-    books_in_vertex_order = list(connected_vertices)
-    book_to_vertex_index = {v: i for i, v in enumerate(books_in_vertex_order)}
-    n = len(books_in_vertex_order)
-    edge_to_weight_unsorted = defaultdict(int)
-    vertex_to_neighbors = defaultdict(set)
-    for book_uri_1, book_uri_2, user_weight in E:
-        l = book_to_vertex_index[book_uri_1]
-        r = book_to_vertex_index[book_uri_2]
-        edge_to_weight_unsorted[(l, r)] += user_weight
-        edge_to_weight_unsorted[(r, l)] += user_weight
-        vertex_to_neighbors[l].add(r)
-        vertex_to_neighbors[r].add(l)
-    # a consistent ordering is useful for the community detection code
-    # sort lists of neighbors
-    vertex_to_neighbors = {u: sorted(list(neighbors)) for u, neighbors in vertex_to_neighbors.items()}
-    # sort edges
-    edge_to_weight = OrderedDict()
-    for u, neighbors in vertex_to_neighbors.items():
-        for v in neighbors:
-            edge_to_weight[(u, v)] = edge_to_weight_unsorted[(u, v)]
-    return books_in_vertex_order, book_to_vertex_index, edge_to_weight, vertex_to_neighbors, n
-
-
-'''
-Convert a graph in adjacency matrix format to an adjacency list
-Input:
-    A: adjacency matrix as a numpy array of dimension (number of vertices) x (number of vertices) 
+    books_in_vertex_order, book_to_vertex_index, graphs = project_books_graph(person_to_books, ['per_user'])
+    return books_in_vertex_order, book_to_vertex_index, graphs['per_user']
+
+'''
+Construct the same graph as create_books_graph, projecting shards of the people
+in parallel worker processes (see project_incidence_sharded).
+The vertex order is the same as for create_books_graph.
+
+Input:
+    person_to_books: dict from member URI (or user ID) to all the books that person interacted with
+    num_workers: number of worker processes (the number of CPUs by default)
+Output:
+    books_in_vertex_order: list of book names in vertex order (sorted, so the order is fixed)
+    book_to_vertex_index: dict from book name to vertex index
+    graph: BookGraph whose edge weights are the number of times book u and book v were interacted with by the same person
+'''
+def create_books_graph_sharded(person_to_books, num_workers=None):
+    books_in_vertex_order, book_to_vertex_index, graphs = project_books_graph(person_to_books, ['count'],
+                                                                              num_workers or os.cpu_count())
+    return books_in_vertex_order, book_to_vertex_index, graphs['count']
+
+# the weighting that build_books_graph_on_disk uses in place of each builder,
+# when load_or_build_books_graph builds a memory-mapped graph
+out_of_core_builders = {
+    create_books_graph: 'count',
+    create_books_graph_sharded: 'count',
+    create_books_graph_weighted_by_user: 'per_user',
+}
+
+
+'''
+Convert a graph in adjacency matrix format to an adjacency list.
+Only the entries greater than zero become edges, and they are found with vectorized nonzero,
+so sparse inputs never need a dense n * n matrix.
+
+Input:
+    A: adjacency matrix of dimension (number of vertices) x (number of vertices), as a numpy array
+       or a scipy.sparse matrix or array; or a NetworkX graph, whose 'weight' edge attributes are used
 Output:
-    vertices_in_order: list of vertex indices in vertex order (the order is arbitrary but fixed)
-    edge_to_weight: dict from vertex index pair (u, v) to number of edges between u and v
-    vertex_to_neighbors: dict from vertex index to a list of all neighboring vertex indices
-    n: number of vertices in the graph
+    vertices_in_order: list of vertices in vertex order: indices for matrices, nodes for NetworkX graphs
+    graph: BookGraph whose edge weights are the number of edges between u and v
 '''
 def convert_adjacency_matrix_to_list(A):
-    edge_to_weight = {}
-    vertex_to_neighbors = defaultdict(list)
-    vertices_in_order = []
+    if isinstance(A, nx.Graph):
+        vertices_in_order = list(A)
+        A = nx.to_scipy_sparse_array(A, nodelist=vertices_in_order, format='coo')
+    else:
+        vertices_in_order = list(range(A.shape[0]))
     n = A.shape[0]
-    for u in range(0, n):
-        vertices_in_order.append(u)
-        for v in range(0, n):
-            if A[u, v] > 0:
-                edge_to_weight[(u,v)] = A[u,v]
-                vertex_to_neighbors[u].append(v)
-    return vertices_in_order, edge_to_weight, vertex_to_neighbors, n
+    if scipy.sparse.issparse(A):
+        A = scipy.sparse.coo_matrix(A)
+        positive = A.data > 0
+        return vertices_in_order, BookGraph.from_edges(A.row[positive], A.col[positive], A.data[positive], n)
+    A = np.asarray(A)
+    sources, targets = np.nonzero(A > 0)
+    return vertices_in_order, BookGraph.from_edges(sources, targets, A[sources, targets], n)
 
 '''
-Save an HTML file that summarizes all the communities.
-For each community, list the vertices that have the highest percentage
+Convert a list of undirected edges to an adjacency list.
+Repeated edges have their weights summed.
+
+Input:
+    sources, targets: arrays of the endpoints of each edge
+    weights: optional array of edge weights (default: 1 for every edge)
+    n: number of vertices (default: one more than the largest endpoint)
+    both_directions: true if the list already has (v, u) for every (u, v);
+                     otherwise every edge is listed once and its reverse is added here
+Output:
+    graph: BookGraph whose edge weights are the number of edges between u and v
+'''
+def convert_edge_list_to_graph(sources, targets, weights=None, n=None, both_directions=False):
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    weights = np.ones(len(sources), dtype=np.int64) if weights is None else np.asarray(weights)
+    if n is None:
+        n = int(max(sources.max(initial=-1), targets.max(initial=-1))) + 1
+    if not both_directions:
+        # self-loops are only stored once
+        off_diagonal = sources != targets
+        sources, targets = np.concatenate([sources, targets[off_diagonal]]), np.concatenate([targets, sources[off_diagonal]])
+        weights = np.concatenate([weights, weights[off_diagonal]])
+    return BookGraph.from_edges(sources, targets, weights, n)
+
+'''
+Get the community of every edge as an array aligned with the graph's edges (CSR order).
+
+Input:
+    graph: BookGraph
+    C: dict from edge to most likely community for that edge, or an array already in edge order
+Output:
+    edge_communities: integer array of length graph.m
+'''
+def get_edge_communities_array(graph, C):
+    if isinstance(C, EdgeValuesView) and C._graph is graph:
+        return C._values
+    if isinstance(C, Mapping):
+        return np.fromiter((C[(u, v)] for u, v in zip(graph.sources.tolist(), graph.indices.tolist())), dtype=np.int64, count=graph.m)
+    return np.asarray(C)
+
+'''
+Get the fraction of each vertex's incident edges that belong to each community,
+with a bincount over (source vertex, community) pairs for each block of edges.
+Edges are counted regardless of their weight.
+
+Input:
+    graph: BookGraph
+    C: most likely community of each edge, as an array in edge order (or a dict from edge to community)
+    K: number of groups
+Output:
+    vertices_by_groups: n * K array; row u sums to 1 for every vertex u with neighbors
+'''
+def get_vertices_by_groups(graph, C, K):
+    edge_communities = get_edge_communities_array(graph, C)
+    counts = np.zeros((graph.n, K), dtype=np.int64)
+    for row_start, row_end in graph.row_blocks():
+        sources = np.repeat(np.arange(row_end - row_start), np.diff(graph.indptr[row_start:row_end+1]))
+        communities = edge_communities[graph.indptr[row_start]:graph.indptr[row_end]]
+        counts[row_start:row_end] = np.bincount(sources * K + communities, minlength=(row_end - row_start) * K).reshape(-1, K)
+    # divide the counts rather than summing fractions, so that equal fractions compare equal
+    return counts / np.maximum(graph.num_neighbors(), 1)[:, None]
+
+'''
+Get the top vertices of each community: the vertices with the highest percentage of
+their incident edges in the community, then the highest degree, then the lowest vertex index.
+Vertices with no edges in a community are never listed for it.
+Uses a partial sort per community, so only the candidates near the top are fully sorted.
+
+Input:
+    vertices_by_groups: n * K array from get_vertices_by_groups
+    degrees: array of the total edge weight of each vertex
+    num_top: maximum number of vertices per community
+Output:
+    top_vertices: list with one array of vertex indices per community, best first
+'''
+def get_top_vertices_by_group(vertices_by_groups, degrees, num_top=100):
+    degrees = np.asarray(degrees)
+    top_vertices = []
+    for z in range(vertices_by_groups.shape[1]):
+        percents = vertices_by_groups[:, z]
+        candidates = np.flatnonzero(percents > 0)
+        if len(candidates) > num_top:
+            # keep everything at least as large as the num_top-th largest percentage, including ties
+            kth_percent = -np.partition(-percents[candidates], num_top - 1)[num_top - 1]
+            candidates = candidates[percents[candidates] >= kth_percent]
+        order = np.lexsort((candidates, -degrees[candidates], -percents[candidates]))
+        top_vertices.append(candidates[order[:num_top]])
+    return top_vertices
+
+'''
+Summarize all the communities: for each community, the vertices that have the highest percentage
 of their incident edges in that community, with higher-degree vertices at the top.
 
 Input:
-    n: number of vertices
-    edge_to_weight: dict from vertex index pair (u, v) to number of times book u and book v were interacted with by the same person
-    vertex_to_neighbors: dict from vertex index to a list of all neighboring vertex indices
-    C: dict from edge to most likely community for that edge
+    graph: BookGraph of the books
+    C: most likely community of each edge, as an array in edge order (or a dict from edge to community)
     K: number of groups
     books_in_vertex_order: list of book names in order
-    dataset: dataset name for saving the file
     book_to_text: dict from book name to summary string
+    num_top: maximum number of books per community
+Output:
+    summaries: list with one list per community of (summary string, fraction of edges in the community, degree)
+'''
+def get_community_summaries(graph, C, K, books_in_vertex_order, book_to_text, num_top=100):
+    vertices_by_groups = get_vertices_by_groups(graph, C, K)
+    degrees = graph.degrees()
+    summaries = []
+    for z, top_vertices in enumerate(get_top_vertices_by_group(vertices_by_groups, degrees, num_top)):
+        summaries.append([(book_to_text[books_in_vertex_order[idx]], vertices_by_groups[idx, z], degrees[idx].item())
+                          for idx in top_vertices.tolist()])
+    return summaries
+
+'''
+Render community summaries from get_community_summaries as an HTML page.
+
+Input:
+    graph: BookGraph of the books
+    summaries: output of get_community_summaries
+    dataset: dataset name for the page header
+Output:
+    html: string with the HTML page
 '''
-def save_html_with_community_summaries(n, edge_to_weight, vertex_to_neighbors, C, K, books_in_vertex_order, dataset, book_to_text):
-    # get the number of neighbors for each vertex
-    degrees = {idx: sum([edge_to_weight[(idx, neighbor)] for neighbor in neighbors])
-               for idx, neighbors in vertex_to_neighbors.items()}
-    degrees_in_order = [degrees[i] for i in range(n)]
-    
+def render_community_summaries_html(graph, summaries, dataset):
     html = ['<html> <link href="https://fonts.googleapis.com/css?family=Nunito:400,600,800" rel="stylesheet"> \
         <link href="https://fonts.googleapis.com/css?family=Nunito+Sans:400,600,800" rel="stylesheet"> \
         <style>body {font-family: "Nunito Sans"; font-size:12pt; padding:20px; display:block;} \
@@ -282,42 +1064,38 @@ def save_html_with_community_summaries(n, edge_to_weight, vertex_to_neighbors, C
         </style>']
     html.append('<body>')
     html.append('<div class="header">{}</div>'.format(dataset))
-    html.append('<div>Vertices: {:,}</div>'.format(n))
-    html.append('<div>Unique edges: {:,}</div>'.format(int(len(edge_to_weight)/2)))
-    html.append('<div>Edges with multiplicity: {:,}</div>'.format(int(sum(list(edge_to_weight.values()))/2)))
-
-    # first get the percentage of each node's edges in each group
-    # store in an n * K (nodes by groups) matrix
-    vertices_by_groups = np.zeros((n, K))
-    for idx in range(n):
-        # look at edge colors for this node, only where there is an edge
-        edge_groups = np.array([C[(idx, neighbor)] for neighbor in vertex_to_neighbors[idx]])
-        for z in range(K):
-            vertices_by_groups[idx, z] = len(edge_groups[edge_groups==z])/len(edge_groups) 
-    # now print highest-degree nodes in each community
-    # sort by percent of edges in group then by degree
-    for z in range(K):
-        names = []
-        summaries = []
-        for percent, idx, uri, d in sorted(zip(vertices_by_groups[:, z], range(n), books_in_vertex_order, degrees_in_order),
-                                            key=operator.itemgetter(0, 3),
-                                            reverse=True)[:100]:
-            if percent == 0:
-                break
-            name = book_to_text[uri]
-            names.append(name)
-            summaries.append('{} ({:.0f}% of {} edges)'.format(name, percent*100, d))
+    html.append('<div>Vertices: {:,}</div>'.format(graph.n))
+    html.append('<div>Unique edges: {:,}</div>'.format(int(graph.m/2)))
+    html.append('<div>Edges with multiplicity: {:,}</div>'.format(int(np.sum(graph.weights)/2)))
+    for z, summary in enumerate(summaries):
         html.append('<div class="gap"></div>')
         html.append('<div class="group-header">Group {}</div>'.format(z))
         html.append('<div>')
-        names = '\n'.join(['<li>{}</li>'.format(name) for name in names])
+        names = '\n'.join(['<li>{}</li>'.format(name) for name, percent, degree in summary])
         html.append('<div class="big-list">{}\n</div>'.format(names))
         html.append('</div>')
         html.append('<div style="clear:both;"></div>')
         html.append('<div style="float:none;"></div>')
     html.append('</body></html>')
+    return '\n'.join(html)
+
+'''
+Save an HTML file that summarizes all the communities.
+For each community, list the vertices that have the highest percentage
+of their incident edges in that community, with higher-degree vertices at the top.
+
+Input:
+    graph: BookGraph of the books
+    C: most likely community of each edge, as an array in edge order (or a dict from edge to community)
+    K: number of groups
+    books_in_vertex_order: list of book names in order
+    dataset: dataset name for saving the file
+    book_to_text: dict from book name to summary string
+'''
+def save_html_with_community_summaries(graph, C, K, books_in_vertex_order, dataset, book_to_text):
+    summaries = get_community_summaries(graph, C, K, books_in_vertex_order, book_to_text)
     with open('{}.html'.format(dataset), 'w') as f:
-        f.write('\n'.join(html))
+        f.write(render_community_summaries_html(graph, summaries, dataset))
 
 '''
 Save a simple .txt file that summarizes all the communities.
@@ -325,28 +1103,161 @@ For each vertex, write the percentage of incident edges that belong to each comm
 For use with karate club dataset.
 
 Input:
-    vertex_to_neighbors: dict from vertex index to a list of all neighboring vertex indices
-    C: dict from edge to most likely community for that edge
+    graph: BookGraph of the vertices
+    C: most likely community of each edge, as an array in edge order (or a dict from edge to community)
     K: number of groups
     vertices_in_order: list of vertex names in order
     dataset: dataset name for saving the file
 '''
-def save_vertices_by_group_percents(vertex_to_neighbors, C, K, vertices_in_order, dataset):
+def save_vertices_by_group_percents(graph, C, K, vertices_in_order, dataset):
     n = len(vertices_in_order)
-    # first get the percentage of each node's edges in each group
-    # store in an n * K (nodes by groups) matrix
-    vertices_by_groups = np.zeros((n, K))
-    for idx in range(n):
-        # look at edge colors for this node, only where there is an edge
-        edge_groups = np.array([C[(idx, neighbor)] for neighbor in vertex_to_neighbors[idx]])
-        for z in range(K):
-            vertices_by_groups[idx, z] = len(edge_groups[edge_groups==z])/len(edge_groups) 
+    vertices_by_groups = get_vertices_by_groups(graph, C, K)
     sorted_vertices_by_group_percents = vertices_by_groups[np.argsort(vertices_by_groups[:, 0])] * 100
     with open('{}_community-percents.txt'.format(dataset), 'w') as f:
         for idx in range(n):
             f.write('Vertex {}: {:.1f}, {:.1f}\n'.format(idx, sorted_vertices_by_group_percents[idx, 0],
                                                           sorted_vertices_by_group_percents[idx, 1]))
 
+'''
+SHA-256 of a file's contents.
+Digests are remembered in the cache directory together with the file's size and modification time,
+so a file is only read again after it changes.
+
+Input:
+    path: path of the file
+Output:
+    digest: hex digest of the file's contents
+'''
+def file_digest(path):
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    digests_path = os.path.join(graph_cache_directory, 'digests.json')
+    digests = {}
+    if os.path.exists(digests_path):
+        with open(digests_path, 'r') as f:
+            digests = json.load(f)
+    key = os.path.abspath(path)
+    if key in digests and digests[key]['signature'] == signature:
+        return digests[key]['digest']
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    digests[key] = {'signature': signature, 'digest': sha.hexdigest()}
+    os.makedirs(graph_cache_directory, exist_ok=True)
+    # one temporary file per process, so concurrent builds never write to the same file
+    temporary_path = '{}.tmp-{}'.format(digests_path, os.getpid())
+    with open(temporary_path, 'w') as f:
+        json.dump(digests, f)
+    os.replace(temporary_path, digests_path)
+    return digests[key]['digest']
+
+'''
+Save a graph and its vertex labels to a directory, one .npy file per array,
+so that the arrays can later be loaded as memory maps.
+
+Input:
+    directory: directory to create
+    graph: BookGraph to save
+    labels: list of vertex labels (strings) in vertex order
+'''
+def save_graph(directory, graph, labels):
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, 'indptr.npy'), graph.indptr)
+    np.save(os.path.join(directory, 'indices.npy'), graph.indices)
+    np.save(os.path.join(directory, 'weights.npy'), graph.weights)
+    with open(os.path.join(directory, 'labels.json'), 'w') as f:
+        json.dump(labels, f)
+
+'''
+Load a graph saved by save_graph.
+
+Input:
+    directory: directory that the graph was saved to
+    mmap_mode: passed to np.load, e.g. 'r' to memory-map the arrays instead of reading them
+Output:
+    labels: list of vertex labels in vertex order
+    graph: BookGraph
+'''
+def load_graph(directory, mmap_mode=None):
+    indptr = np.load(os.path.join(directory, 'indptr.npy'), mmap_mode=mmap_mode)
+    indices = np.load(os.path.join(directory, 'indices.npy'), mmap_mode=mmap_mode)
+    weights = np.load(os.path.join(directory, 'weights.npy'), mmap_mode=mmap_mode)
+    with open(os.path.join(directory, 'labels.json'), 'r') as f:
+        labels = json.load(f)
+    return labels, BookGraph(indptr, indices, weights)
+
+'''
+Load a books graph from the on-disk cache, or build and cache it.
+The cache key is a hash of the builder's name and the contents of every input file,
+so changing any input file (or switching builders) automatically builds a new graph.
+
+Input:
+    builder: create_books_graph or create_books_graph_weighted_by_user
+    get_person_to_books: function with no arguments that returns the builder's input,
+                         only called if the graph is not already cached
+    input_paths: paths of all the files that the builder's input is computed from
+    mmap_mode: optional mode to memory-map the cached graph with, e.g. 'r' (see load_graph).
+               The graphs of the builders in out_of_core_builders are then also built on disk, block by block
+Output:
+    books_in_vertex_order, book_to_vertex_index, graph: as returned by builder
+'''
+def load_or_build_books_graph(builder, get_person_to_books, input_paths, mmap_mode=None):
+    directory = books_graph_cache_directory(builder, input_paths)
+    if not os.path.exists(directory):
+        # write to a temporary directory first so that an interrupted save never looks like a cached graph
+        temporary_directory = '{}.tmp-{}'.format(directory, os.getpid())
+        if mmap_mode is not None and builder in out_of_core_builders:
+            build_books_graph_on_disk(get_person_to_books(), temporary_directory, out_of_core_builders[builder])
+        else:
+            books_in_vertex_order, _, graph = builder(get_person_to_books())
+            save_graph(temporary_directory, graph, books_in_vertex_order)
+        try:
+            os.rename(temporary_directory, directory)
+        except OSError:
+            # another process cached the same graph first
+            shutil.rmtree(temporary_directory)
+    books_in_vertex_order, graph = load_graph(directory, mmap_mode)
+    book_to_vertex_index = {v: i for i, v in enumerate(books_in_vertex_order)}
+    return books_in_vertex_order, book_to_vertex_index, graph
+
+# directory that load_or_build_books_graph caches a graph in
+def books_graph_cache_directory(builder, input_paths):
+    return os.path.join(graph_cache_directory, cache_key(builder.__name__, input_paths))
+
+# cache key for something computed by name (e.g. a builder) from the given input files
+def cache_key(name, input_paths):
+    key = hashlib.sha256()
+    key.update('{}\n{}\n'.format(graph_cache_version, name).encode())
+    for path in input_paths:
+        key.update(file_digest(path).encode())
+    return key.hexdigest()
+
+'''
+Load a small JSON-serializable result from the cache, or compute and cache it.
+Used for summaries of the inputs that are much cheaper to read back than to recompute,
+like the number of events per book, which otherwise needs the whole events file.
+
+Input:
+    name: name of the computation, part of the cache key
+    compute: function with no arguments that computes the result
+    input_paths: list of input files the result depends on
+Output:
+    result: the computed or cached result, as loaded from JSON
+'''
+def load_or_compute_json(name, compute, input_paths):
+    path = os.path.join(graph_cache_directory, '{}.json'.format(cache_key(name, input_paths)))
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    result = compute()
+    os.makedirs(graph_cache_directory, exist_ok=True)
+    temporary_path = '{}.tmp-{}'.format(path, os.getpid())
+    with open(temporary_path, 'w') as f:
+        json.dump(result, f)
+    os.replace(temporary_path, path)
+    return result
+
 '''
 Maps SC readers to the books they borrowed. For external use.
 
@@ -354,68 +1265,303 @@ Output:
     sc_borrower_to_books: dict mapping reader URI in SC to list of book URIs borrowed
 '''
 def get_sc_borrower_to_books():
-    books, members, events = load_shakespeare_and_company_data('data')
+    books, store = load_shakespeare_and_company_store('data')
     # limit to books also in goodreads
     with open('data/book-uris-in-both-goodreads-and-sc.json', 'r') as f:
         overlap_book_uris = json.load(f)
     # get a dict of person to books they borrowed
-    return internal_get_sc_borrower_to_books(books, events, overlap_book_uris)
+    return store.get_borrower_to_books(overlap_book_uris)
 
-# for using the shakespeare and company graph
-# note: indexes vertices by full descriptive text rather than book URI
-def get_sc_graph():
-    # load the full shakespeare and company dataset
-    books, members, events = load_shakespeare_and_company_data('data')
-    # limit to books also in goodreads
-    with open('data/book-uris-in-both-goodreads-and-sc.json', 'r') as f:
-        overlap_book_uris = json.load(f)
-    # get a dict of person to books they borrowed
-    sc_borrower_to_books = internal_get_sc_borrower_to_books(books, events, overlap_book_uris)
+'''
+Everything about one dataset's books graph, computed lazily and memoized,
+so that each script only pays for what it uses: reading bundle.popularity
+or bundle.book_to_title never builds or loads the graph.
+Use get_sc_bundle or get_goodreads_bundle to share one bundle per process.
 
-    books_in_vertex_order, book_to_vertex_index, edge_to_weight, vertex_to_neighbors, n = create_books_graph(sc_borrower_to_books)
+    vertex_ids: book ids (SC URIs or Goodreads ids) in vertex order
+    graph: BookGraph of the books
+    labels: descriptive text of each book in vertex order
+    book_to_vertex_index: dict from descriptive text to vertex index
+    vertex_id_to_index: dict from book id to vertex index
+    book_to_text: dict from book id to descriptive text
+    popularity: dict from book id to number of events (SC) or ratings (Goodreads)
+    neighbor_index: NeighborIndex of the graph, cached next to the graph
 
-    # and now use more descriptive text for the books
-    book_uri_to_text = map_book_uris_to_text(books)
-    books_in_vertex_order = [book_uri_to_text[goodreads_id] for goodreads_id in books_in_vertex_order]
-    book_to_vertex_index = {text: vertex_idx for vertex_idx, text in enumerate(books_in_vertex_order)}
+Subclasses implement the dataset-specific hooks:
+    input_paths: data files the graph is built from, which key its cache (see load_or_build_books_graph)
+    get_person_to_books(): the readers' books to build the graph from
+    load_book_to_text(): dict from book id to descriptive text
+    load_popularity(): dict from book id to number of events or ratings
 
-    book_uri_to_year = map_book_uris_to_year(books)
-    book_uri_to_title = map_book_uris_to_title(books)
-    book_uri_to_author = map_book_uris_to_author(books)
+Input:
+    builder: create_books_graph or create_books_graph_weighted_by_user
+    mmap_mode: optional mode to memory-map the graph with, e.g. 'r' (see load_or_build_books_graph)
+'''
+class GraphBundle(abc.ABC):
+    def __init__(self, builder=create_books_graph, mmap_mode=None):
+        self.builder = builder
+        self.mmap_mode = mmap_mode
 
-    # get popularity
-    sc_book_uri_to_num_events = count_events_per_book_sc(books, members, events)
+    @property
+    @abc.abstractmethod
+    def input_paths(self):
+        pass
 
-    return books_in_vertex_order, book_to_vertex_index, edge_to_weight, vertex_to_neighbors, n, sc_book_uri_to_num_events, book_uri_to_text, book_uri_to_year, book_uri_to_title, book_uri_to_author
-    
+    @abc.abstractmethod
+    def get_person_to_books(self):
+        pass
 
-# for using the goodreads graph
-# note: indexes vertices by full descriptive text rather than goodreads id
-def get_goodreads_graph():
-    # get the preprocessed dict of person to books they reviewed
-    with open('data/goodreads-user-to-books.json', 'r') as f:
-        goodreads_user_to_books = json.load(f)
-    books_in_vertex_order, book_to_vertex_index, edge_to_weight, vertex_to_neighbors, n = create_books_graph(goodreads_user_to_books)
+    @abc.abstractmethod
+    def load_book_to_text(self):
+        pass
+
+    @abc.abstractmethod
+    def load_popularity(self):
+        pass
+
+    def load_graph(self):
+        return load_or_build_books_graph(self.builder, self.get_person_to_books, self.input_paths, self.mmap_mode)
+
+    @functools.cached_property
+    def vertex_ids_and_graph(self):
+        vertex_ids, _, graph = self.load_graph()
+        return vertex_ids, graph
+
+    @property
+    def vertex_ids(self):
+        return self.vertex_ids_and_graph[0]
+
+    @property
+    def graph(self):
+        return self.vertex_ids_and_graph[1]
+
+    @functools.cached_property
+    def book_to_text(self):
+        return self.load_book_to_text()
+
+    @functools.cached_property
+    def labels(self):
+        return [self.book_to_text[book_id] for book_id in self.vertex_ids]
+
+    @functools.cached_property
+    def book_to_vertex_index(self):
+        return {text: vertex_idx for vertex_idx, text in enumerate(self.labels)}
+
+    @functools.cached_property
+    def vertex_id_to_index(self):
+        return {book_id: vertex_idx for vertex_idx, book_id in enumerate(self.vertex_ids)}
+
+    @functools.cached_property
+    def popularity(self):
+        return self.load_popularity()
 
-    # and now use more descriptive text for the books
-    with open('data/goodreads-book-id-to-text.json', 'r') as f:
-        goodreads_book_id_to_text = json.load(f)
-    books_in_vertex_order = [goodreads_book_id_to_text[goodreads_id] for goodreads_id in books_in_vertex_order]
-    book_to_vertex_index = {text: vertex_idx for vertex_idx, text in enumerate(books_in_vertex_order)}
+    @functools.cached_property
+    def neighbor_index(self):
+        # make sure that the graph is built and cached before caching its index
+        self.graph
+        directory = os.path.join(books_graph_cache_directory(self.builder, self.input_paths),
+                                 'neighbors-{}'.format(neighbor_index_k))
+        if os.path.exists(directory):
+            return NeighborIndex.load(directory, neighbor_index_k)
+        index = NeighborIndex.from_graph(self.graph, neighbor_index_k)
+        temporary_directory = '{}.tmp-{}'.format(directory, os.getpid())
+        index.save(temporary_directory)
+        try:
+            os.rename(temporary_directory, directory)
+        except OSError:
+            # another process cached the same index first
+            shutil.rmtree(temporary_directory)
+        return index
 
-    # now get popularity
-    gr_book_id_to_num_ratings = get_goodreads_num_ratings()
+    # vertex index of a book given by its id (SC URI or Goodreads id) or its descriptive text
+    def vertex_index(self, book):
+        if book in self.vertex_id_to_index:
+            return self.vertex_id_to_index[book]
+        if str(book) in self.vertex_id_to_index:
+            return self.vertex_id_to_index[str(book)]
+        return self.book_to_vertex_index[book]
 
-    return books_in_vertex_order, book_to_vertex_index, edge_to_weight, vertex_to_neighbors, n, gr_book_id_to_num_ratings, goodreads_book_id_to_text
+    '''
+    Get the strongest neighbors of a book, from the neighbor index.
+
+    Input:
+        book: SC URI, Goodreads id or descriptive text of the book
+        k: number of neighbors, at most neighbor_index_k
+    Output:
+        neighbors: list of (descriptive text, edge weight) pairs, strongest first
+    '''
+    def top_neighbors(self, book, k=10):
+        neighbors, weights = self.neighbor_index.top(self.vertex_index(book), k)
+        return [(self.labels[v], w) for v, w in zip(neighbors.tolist(), weights.tolist())]
+
+'''
+The Shakespeare and Company books graph, limited to books also in Goodreads.
+Besides the common attributes, the bundle has the book metadata
+(book_to_year, book_to_title, book_to_author, all keyed by book URI)
+and the EventStore of the dataset's events (store).
+'''
+class ShakespeareAndCompanyBundle(GraphBundle):
+    folder = 'data'
+    overlap_path = 'data/book-uris-in-both-goodreads-and-sc.json'
+
+    @functools.cached_property
+    def paths(self):
+        return get_shakespeare_and_company_paths(self.folder)
+
+    @functools.cached_property
+    def input_paths(self):
+        return list(self.paths) + [self.overlap_path]
+
+    @functools.cached_property
+    def store(self):
+        books_path, members_path, events_path = self.paths
+        return EventStore.from_json_file(events_path)
+
+    def get_person_to_books(self):
+        with open(self.overlap_path, 'r') as f:
+            overlap_book_uris = json.load(f)
+        # get a dict of person to books they borrowed
+        return self.store.get_borrower_to_books(overlap_book_uris)
+
+    # text, year, title and author of every book, cached since they only depend on the books file
+    @functools.cached_property
+    def metadata(self):
+        books_path, members_path, events_path = self.paths
+        def compute_metadata():
+            with open(books_path, 'r') as f:
+                books = {book['uri']: book for book in json.load(f)}
+            return dict(zip(['text', 'year', 'title', 'author'], map_book_uris_to_metadata(books)))
+        return load_or_compute_json('sc-book-metadata', compute_metadata, [books_path])
+
+    def load_book_to_text(self):
+        return self.metadata['text']
+
+    @functools.cached_property
+    def book_to_year(self):
+        return defaultdict(str, self.metadata['year'])
+
+    @functools.cached_property
+    def book_to_title(self):
+        return defaultdict(str, self.metadata['title'])
+
+    @functools.cached_property
+    def book_to_author(self):
+        return defaultdict(str, self.metadata['author'])
+
+    # number of borrows and purchases per book URI, cached since counting needs the whole events file
+    def load_popularity(self):
+        books_path, members_path, events_path = self.paths
+        num_events = load_or_compute_json('sc-book-num-events',
+                                          lambda: self.store.count_events_per_book(['Borrow', 'Purchase']),
+                                          [events_path])
+        return defaultdict(int, num_events)
+
+'''
+The Goodreads books graph of the books matched to Shakespeare and Company.
+'''
+class GoodreadsBundle(GraphBundle):
+    user_to_books_path = 'data/goodreads-user-to-books.json'
+    # written by ingest-goodreads-interactions.py; used instead of user_to_books_path when it exists
+    reader_books_path = 'data/goodreads-reader-books.npz'
+
+    @property
+    def input_paths(self):
+        if os.path.exists(self.reader_books_path):
+            return [self.reader_books_path]
+        return [self.user_to_books_path]
+
+    def get_person_to_books(self):
+        if os.path.exists(self.reader_books_path):
+            return ReaderBooks.load(self.reader_books_path)
+        with open(self.user_to_books_path, 'r') as f:
+            return json.load(f)
+
+    def load_book_to_text(self):
+        with open('data/goodreads-book-id-to-text.json', 'r') as f:
+            return json.load(f)
+
+    def load_popularity(self):
+        return get_goodreads_num_ratings()
+
+# one shared bundle per dataset and builder in each process
+@functools.lru_cache(maxsize=None)
+def get_sc_bundle(builder=create_books_graph, mmap_mode=None):
+    return ShakespeareAndCompanyBundle(builder, mmap_mode)
+
+@functools.lru_cache(maxsize=None)
+def get_goodreads_bundle(builder=create_books_graph, mmap_mode=None):
+    return GoodreadsBundle(builder, mmap_mode)
+
+'''
+Alignment of the Goodreads and Shakespeare and Company graphs through their matched books.
+Every map is an integer array, so that vectors, adjacency rows or whole matrices
+are re-indexed from one graph to the other with a single fancy-indexing operation.
+The canonical order lists the matched books sorted by Goodreads id.
+Books missing from a graph (or vertices that are not matched) map to -1.
+
+    goodreads_ids, sc_uris: ids of the matched books in canonical order
+    num_books: number of matched books
+    canonical_to_gr, canonical_to_sc: vertex index in each graph of each matched book
+    gr_to_canonical, sc_to_canonical: canonical position of each vertex of each graph
+    gr_to_sc, sc_to_gr: vertex index in the other graph of each vertex of each graph
+
+Input:
+    goodreads_book_id_to_sc_uri: dict from Goodreads id to SC URI of every matched book
+    gr_vertex_ids: Goodreads ids in Goodreads vertex order
+    sc_vertex_ids: SC URIs in SC vertex order
+'''
+class VertexAlignment:
+    def __init__(self, goodreads_book_id_to_sc_uri, gr_vertex_ids, sc_vertex_ids):
+        matches = sorted(goodreads_book_id_to_sc_uri.items())
+        self.goodreads_ids = [gr_book_id for gr_book_id, _ in matches]
+        self.sc_uris = [sc_uri for _, sc_uri in matches]
+        self.num_books = len(matches)
+        self.canonical_to_gr, self.gr_to_canonical = self.index_maps(self.goodreads_ids, gr_vertex_ids)
+        self.canonical_to_sc, self.sc_to_canonical = self.index_maps(self.sc_uris, sc_vertex_ids)
+        self.gr_to_sc = self.compose(self.gr_to_canonical, self.canonical_to_sc)
+        self.sc_to_gr = self.compose(self.sc_to_canonical, self.canonical_to_gr)
+
+    # maps from canonical position to vertex index and back, for one graph
+    @staticmethod
+    def index_maps(canonical_ids, vertex_ids):
+        id_to_vertex_index = {book_id: vertex_idx for vertex_idx, book_id in enumerate(vertex_ids)}
+        canonical_to_vertex = np.array([id_to_vertex_index.get(book_id, -1) for book_id in canonical_ids], dtype=np.int64)
+        vertex_to_canonical = np.full(len(vertex_ids), -1, dtype=np.int64)
+        in_graph = canonical_to_vertex >= 0
+        vertex_to_canonical[canonical_to_vertex[in_graph]] = np.flatnonzero(in_graph)
+        return canonical_to_vertex, vertex_to_canonical
+
+    # apply second after first, keeping -1 for missing entries
+    @staticmethod
+    def compose(first, second):
+        return np.where(first >= 0, second[first], -1)
+
+    @classmethod
+    def from_bundles(cls, gr_bundle, sc_bundle, path='data/goodreads-book-id-to-sc-uri.json'):
+        with open(path, 'r') as f:
+            goodreads_book_id_to_sc_uri = json.load(f)
+        return cls(goodreads_book_id_to_sc_uri, gr_bundle.vertex_ids, sc_bundle.vertex_ids)
+
+# for using the shakespeare and company graph
+# note: indexes vertices by full descriptive text rather than book URI
+# builder: create_books_graph or create_books_graph_weighted_by_user
+def get_sc_graph(builder=create_books_graph):
+    bundle = get_sc_bundle(builder)
+    return bundle.labels, bundle.book_to_vertex_index, bundle.graph, bundle.popularity, bundle.book_to_text, bundle.book_to_year, bundle.book_to_title, bundle.book_to_author
+
+# for using the goodreads graph
+# note: indexes vertices by full descriptive text rather than goodreads id
+# builder: create_books_graph or create_books_graph_weighted_by_user
+def get_goodreads_graph(builder=create_books_graph):
+    bundle = get_goodreads_bundle(builder)
+    return bundle.labels, bundle.book_to_vertex_index, bundle.graph, bundle.popularity, bundle.book_to_text
 
 # count number of events per book in SC
+# events: EventStore, or list of event data
 def count_events_per_book_sc(books, members, events):
-    book_to_num_events = defaultdict(int)
-    for event in events:
-        if event['event_type'] == 'Borrow' or event['event_type'] == 'Purchase':
-            book_uri = event['item']['uri']
-            book_to_num_events[book_uri] += 1
-    return book_to_num_events
+    if not isinstance(events, EventStore):
+        events = EventStore.from_events(events)
+    return events.count_events_per_book(['Borrow', 'Purchase'])
 
 # get the number of ratings for matched goodreads books
 def get_goodreads_num_ratings():
@@ -0,0 +1,36 @@
+from goodreads_interactions import ingest_goodreads_interactions, interactions_chunk_size
+import json
+
+import argparse
+
+# parse the command-line arguments
+def parse_args():
+    parser = argparse.ArgumentParser()
+    # goodreads_interactions.csv or goodreads_interactions_dedup.json from the UCSD Goodreads datasets, optionally gzipped
+    parser.add_argument('interactions_path')
+    # book_id_map.csv from the same datasets, needed for goodreads_interactions.csv
+    parser.add_argument('--book_id_map', default=None)
+    # keep the interactions with the Goodreads books that were matched to Shakespeare and Company books
+    parser.add_argument('--book_ids', default='data/goodreads-book-id-to-sc-uri.json')
+    parser.add_argument('--output', default='data/goodreads-reader-books.npz')
+    # also save the result in the format of data/goodreads-user-to-books.json
+    parser.add_argument('--json_output', default=None)
+    parser.add_argument('--min_rating', type=int, default=None)
+    parser.add_argument('--require_read', action='store_true', default=False)
+    parser.add_argument('--chunk_size', type=int, default=interactions_chunk_size)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    with open(args.book_ids, 'r') as f:
+        keep_book_ids = list(json.load(f))
+    reader_books = ingest_goodreads_interactions(args.interactions_path, keep_book_ids, args.book_id_map,
+                                                 args.min_rating, args.require_read, args.chunk_size)
+    print('# of users: {:,}'.format(len(reader_books)))
+    print('# of interactions: {:,}'.format(reader_books.num_interactions))
+    reader_books.save(args.output)
+    if args.json_output is not None:
+        reader_books.save_json(args.json_output)
+
+if __name__ == '__main__':
+    main()
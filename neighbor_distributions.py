@@ -0,0 +1,63 @@
+import numpy as np
+import scipy.sparse
+import pandas as pd
+
+'''
+Compare two sets of neighbor distributions, one pair of rows at a time, all pairs at once.
+Row i of p_weights and row i of q_weights are the neighbor weights of two books that should be compared
+(e.g. the same book in Shakespeare and Company and in Goodreads), with columns in a shared order.
+Every row is smoothed with the same uniform prior and normalized to a probability distribution,
+exactly as if prior were added to every entry of a dense row, but the entries that are zero in
+both rows are all equal, so they are handled in closed form and never materialized.
+
+Input:
+    p_weights, q_weights: scipy.sparse matrices with the same shape (number of pairs, number of columns)
+    prior: pseudo-count added to every column before normalizing
+    names: prefixes of the per-row columns of the output, for p_weights and q_weights
+Output:
+    table: pandas DataFrame with one row per pair and columns
+           js_divergence: Jensen-Shannon divergence between the two smoothed distributions (natural log)
+           p_entropy, q_entropy: entropy of each smoothed distribution
+           p_num_neighbors, q_num_neighbors: number of nonzero entries in each row
+'''
+def js_divergence_table(p_weights, q_weights, prior=0.01, names=('p', 'q')):
+    p_weights = scipy.sparse.coo_matrix(p_weights)
+    q_weights = scipy.sparse.coo_matrix(q_weights)
+    if p_weights.shape != q_weights.shape:
+        raise ValueError('cannot compare rows of shapes {} and {}'.format(p_weights.shape, q_weights.shape))
+    num_rows, num_columns = p_weights.shape
+
+    # entries in the union of the two rows' supports, and the weight of each row at them
+    keys = np.concatenate([p_weights.row.astype(np.int64) * num_columns + p_weights.col,
+                           q_weights.row.astype(np.int64) * num_columns + q_weights.col])
+    union_keys, inverse = np.unique(keys, return_inverse=True)
+    p_union = np.bincount(inverse[:p_weights.nnz], weights=p_weights.data, minlength=len(union_keys))
+    q_union = np.bincount(inverse[p_weights.nnz:], weights=q_weights.data, minlength=len(union_keys))
+    union_rows = union_keys // num_columns
+    num_zeros = num_columns - np.bincount(union_rows, minlength=num_rows)
+
+    # smoothed probabilities: at the union entries, and at every other entry
+    p_totals = np.bincount(p_weights.row, weights=p_weights.data, minlength=num_rows) + num_columns * prior
+    q_totals = np.bincount(q_weights.row, weights=q_weights.data, minlength=num_rows) + num_columns * prior
+    p = (p_union + prior) / p_totals[union_rows]
+    q = (q_union + prior) / q_totals[union_rows]
+    m = (p + q) / 2
+    p_zero = prior / p_totals
+    q_zero = prior / q_totals
+    m_zero = (p_zero + q_zero) / 2
+
+    def row_sums(values):
+        return np.bincount(union_rows, weights=values, minlength=num_rows)
+
+    js = 0.5 * (row_sums(p * np.log(p / m)) + num_zeros * p_zero * np.log(p_zero / m_zero)) \
+       + 0.5 * (row_sums(q * np.log(q / m)) + num_zeros * q_zero * np.log(q_zero / m_zero))
+    p_entropy = -row_sums(p * np.log(p)) - num_zeros * p_zero * np.log(p_zero)
+    q_entropy = -row_sums(q * np.log(q)) - num_zeros * q_zero * np.log(q_zero)
+    p_name, q_name = names
+    return pd.DataFrame({
+        'js_divergence': js,
+        '{}_entropy'.format(p_name): p_entropy,
+        '{}_entropy'.format(q_name): q_entropy,
+        '{}_num_neighbors'.format(p_name): np.bincount(p_weights.row[p_weights.data != 0], minlength=num_rows),
+        '{}_num_neighbors'.format(q_name): np.bincount(q_weights.row[q_weights.data != 0], minlength=num_rows),
+    })
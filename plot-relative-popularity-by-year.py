@@ -1,4 +1,4 @@
-from graph import get_goodreads_graph, get_sc_graph
+from graph import get_sc_bundle
 import json
 import numpy as np
 import math
@@ -19,11 +19,11 @@ if not os.path.exists(output_directory_path):
 
 def plot_relative_popularity_by_year():
 
-    # get the shakespeare and company graph
-    sc_books_in_vertex_order, sc_book_to_vertex_index, sc_edge_to_weight, sc_vertex_to_neighbors, sc_n, sc_book_uri_to_num_events, sc_book_uri_to_text, sc_book_uri_to_year, sc_book_uri_to_title, sc_book_uri_to_author = get_sc_graph()
-
-    # and now get the goodreads graph
-    gr_books_in_vertex_order, gr_book_to_vertex_index, gr_edge_to_weight, gr_vertex_to_neighbors, gr_n, gr_book_id_to_num_ratings, gr_book_id_to_text = get_goodreads_graph()
+    # only popularity and metadata are needed, so neither graph is built
+    sc_bundle = get_sc_bundle()
+    sc_book_uri_to_num_events = sc_bundle.popularity
+    sc_book_uri_to_title = sc_bundle.book_to_title
+    sc_book_uri_to_author = sc_bundle.book_to_author
 
     with open('data/goodreads-book-id-to-sc-uri_full-matching.json', 'r') as f:
         goodreads_book_id_to_sc_uri = json.load(f)
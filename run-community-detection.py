@@ -7,18 +7,82 @@ from collections import defaultdict, OrderedDict
 import itertools
 import operator
 import math
+import os
 
-from community_detection import get_communities
+from community_detection import get_communities, sweep_communities, EMTrace
 
 import argparse
 
 # parse the command-line arguments
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--num_groups', required=True, type=int)
+    groups = parser.add_mutually_exclusive_group(required=True)
+    groups.add_argument('--num_groups', type=int)
+    # try every number of groups in a range, warm-starting each from the previous one,
+    # and keep the one with the best information criterion
+    groups.add_argument('--sweep', nargs=2, type=int, metavar=('MIN_GROUPS', 'MAX_GROUPS'))
+    parser.add_argument('--criterion', choices=['bic', 'aic'], default='bic')
+    parser.add_argument('--patience', type=int, default=2)
     parser.add_argument('--verbose', action='store_true', default=False)
+    parser.add_argument('--seed', type=int, default=None)
+    # save the state of the algorithm here, so that an interrupted run resumes where it stopped
+    # when the script is run again with the same seed, or without --seed (the seed is saved there too)
+    parser.add_argument('--checkpoint_directory', default=None)
+    # stop when the log-likelihood changes by less than this; resuming with a smaller value refines a finished run
+    parser.add_argument('--tolerance', type=float, default=None)
+    # stop after at most this many iterations
+    parser.add_argument('--max_iterations', type=int, default=None)
+    # print the log-likelihood and timings of every iteration
+    parser.add_argument('--progress', action='store_true', default=False)
+    # save the timings, sizes and log-likelihoods of every iteration to [dataset]_trace.json
+    parser.add_argument('--trace', action='store_true', default=False)
+    # run the EM algorithm over blocks of at most this many edges at a time, without holding q for all edges
+    parser.add_argument('--block_size', type=int, default=None)
+    # run stochastic EM on mini-batches of this many edges, then at most this many exact iterations
+    parser.add_argument('--batch_size', type=int, default=None)
+    parser.add_argument('--exact_iterations', type=int, default=0)
+    # keep only each book's largest memberships: at most this many, each at least this share of the book's total,
+    # so that runs with hundreds of groups fit in memory
+    parser.add_argument('--max_memberships', type=int, default=None)
+    parser.add_argument('--min_membership', type=float, default=None)
     return parser.parse_args()
 
+# run community detection with the number of groups from the arguments, or sweep over a range of them
+# returns the number of groups and the community of each edge
+def detect_communities(graph, args, name):
+    trace = None
+    if args.progress or args.trace:
+        trace = EMTrace(print_progress=args.progress)
+    num_groups, edge_communities = run_detection(graph, args, name, trace)
+    if args.trace:
+        trace.save('{}_trace.json'.format(name))
+    return num_groups, edge_communities
+
+def run_detection(graph, args, name, trace):
+    checkpoint_directory = None
+    if args.checkpoint_directory is not None:
+        checkpoint_directory = os.path.join(args.checkpoint_directory, name)
+    if args.sweep is None:
+        if checkpoint_directory is not None:
+            checkpoint_directory = os.path.join(checkpoint_directory, '{}-groups'.format(args.num_groups))
+        result = get_communities(graph, args.num_groups, 1, args.verbose, seed=args.seed, symmetric=True,
+                                 checkpoint_directory=checkpoint_directory, tolerance=args.tolerance, trace=trace,
+                                 block_size=args.block_size, batch_size=args.batch_size, exact_iterations=args.exact_iterations,
+                                 max_memberships=args.max_memberships, min_membership=args.min_membership,
+                                 max_iterations=args.max_iterations)
+        return args.num_groups, result.edge_communities
+    min_groups, max_groups = args.sweep
+    sweep = sweep_communities(graph, min_groups, max_groups, 1, args.verbose, seed=args.seed, symmetric=True,
+                              criterion=args.criterion, patience=args.patience,
+                              checkpoint_directory=checkpoint_directory, tolerance=args.tolerance, trace=trace,
+                              block_size=args.block_size, batch_size=args.batch_size, exact_iterations=args.exact_iterations,
+                              max_memberships=args.max_memberships, min_membership=args.min_membership,
+                              max_iterations=args.max_iterations)
+    print('Groups\tLog-likelihood\t{}'.format(sweep.criterion.upper()))
+    for K, result in sweep.results.items():
+        print('{}\t{:.4f}\t{:.4f}{}'.format(K, result.ll, sweep.criteria[K], '\tbest' if K == sweep.best_K else ''))
+    return sweep.best_K, sweep.best.edge_communities
+
 def main():
     args = parse_args()
 
@@ -27,14 +91,13 @@ def main():
     # The vertices get split into two clear groups,
     # which you can see in the resulting text file 'karate_community-percents.txt'.
     G = nx.karate_club_graph()
-    A = nx.to_numpy_array(G)
-    vertices_in_order, edge_to_weight, vertex_to_neighbors, n = convert_adjacency_matrix_to_list(A)
-    C = get_communities(edge_to_weight, vertex_to_neighbors, n, 2, 5, False)
-    export_to_gephi(edge_to_weight, vertices_in_order, 'karate', C)
-    save_vertices_by_group_percents(vertex_to_neighbors, C, 2, vertices_in_order, 'karate')
+    vertices_in_order, graph = convert_adjacency_matrix_to_list(G)
+    edge_communities = get_communities(graph, 2, 5, False, seed=args.seed, symmetric=True).edge_communities
+    export_to_gephi(graph, vertices_in_order, 'karate', edge_communities)
+    save_vertices_by_group_percents(graph, edge_communities, 2, vertices_in_order, 'karate')
 
     # load the full shakespeare and company dataset
-    books, members, events = load_shakespeare_and_company_data('data')
+    books, store = load_shakespeare_and_company_store('data')
     book_uri_to_text = map_book_uris_to_text(books)
     
     # load the books that are present in both Shakespeare and Company and the UCSD Goodreads book graph
@@ -53,29 +116,29 @@ def main():
     #       n.b SC and Goodreads contain a different number of connected books,
     #           so the graphs have different numbers of vertices
     # these are dicts from person to books they interacted with
-    sc_borrower_to_books = internal_get_sc_borrower_to_books(books, events, overlap_book_uris)
-    with open('data/goodreads-user-to-books.json', 'r') as f:
-        goodreads_user_to_books = json.load(f)
+    sc_borrower_to_books = store.get_borrower_to_books(overlap_book_uris)
+    # the output of ingest-goodreads-interactions.py when it exists, otherwise goodreads-user-to-books.json
+    goodreads_user_to_books = get_goodreads_bundle().get_person_to_books()
 
     # Shakespeare and Company: create a graph and run the community detection algorithm
-    dataset = 'shakespeare-and-company_{}-groups'.format(args.num_groups)
-    books_in_vertex_order, book_to_vertex_index, edge_to_weight, vertex_to_neighbors, n = create_books_graph(sc_borrower_to_books)
-    print('Shakespeare and Company, # of vertices: {:,}'.format(n))
-    print('Shakespeare and Company, # of unique edges: {:,}'.format(int(len(edge_to_weight)/2)))
-    C = get_communities(edge_to_weight, vertex_to_neighbors, n, args.num_groups, 1, args.verbose)
+    books_in_vertex_order, book_to_vertex_index, graph = create_books_graph(sc_borrower_to_books)
+    print('Shakespeare and Company, # of vertices: {:,}'.format(graph.n))
+    print('Shakespeare and Company, # of unique edges: {:,}'.format(int(graph.m/2)))
+    num_groups, edge_communities = detect_communities(graph, args, 'shakespeare-and-company')
+    dataset = 'shakespeare-and-company_{}-groups'.format(num_groups)
     # save the results in html and gephi format
-    save_html_with_community_summaries(n, edge_to_weight, vertex_to_neighbors, C, args.num_groups, books_in_vertex_order, dataset, book_uri_to_text)
-    export_to_gephi(edge_to_weight, books_in_vertex_order, dataset, C)
+    save_html_with_community_summaries(graph, edge_communities, num_groups, books_in_vertex_order, dataset, book_uri_to_text)
+    export_to_gephi(graph, books_in_vertex_order, dataset, edge_communities)
 
     # Goodreads: create a graph and run the community detection algorithm
-    dataset = 'goodreads_{}-groups'.format(args.num_groups)
-    books_in_vertex_order, book_to_vertex_index, edge_to_weight, vertex_to_neighbors, n = create_books_graph(goodreads_user_to_books)
-    print('Goodreads, # of vertices: {:,}'.format(n))
-    print('Goodreads, # of unique edges: {:,}'.format(int(len(edge_to_weight)/2)))
-    C = get_communities(edge_to_weight, vertex_to_neighbors, n, args.num_groups, 1, args.verbose)
+    books_in_vertex_order, book_to_vertex_index, graph = create_books_graph(goodreads_user_to_books)
+    print('Goodreads, # of vertices: {:,}'.format(graph.n))
+    print('Goodreads, # of unique edges: {:,}'.format(int(graph.m/2)))
+    num_groups, edge_communities = detect_communities(graph, args, 'goodreads')
+    dataset = 'goodreads_{}-groups'.format(num_groups)
     # save the results in html and gephi format
-    save_html_with_community_summaries(n, edge_to_weight, vertex_to_neighbors, C, args.num_groups, books_in_vertex_order, dataset, goodreads_book_id_to_text)
-    export_to_gephi(edge_to_weight, books_in_vertex_order, dataset, C)
+    save_html_with_community_summaries(graph, edge_communities, num_groups, books_in_vertex_order, dataset, goodreads_book_id_to_text)
+    export_to_gephi(graph, books_in_vertex_order, dataset, edge_communities)
     
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import networkx as nx
+import pytest
+
+# the modules live at the top of the repository, next to the scripts that use them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graph import convert_adjacency_matrix_to_list
+
+
+# weighted co-appearance graph of Les Miserables: 77 vertices and 254 undirected edges
+@pytest.fixture(scope='session')
+def les_miserables():
+    _, graph = convert_adjacency_matrix_to_list(nx.les_miserables_graph())
+    return graph
@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+import community_detection as cd
+
+K = 5
+seeds = [0, 1, 2, 3]
+
+
+def assert_same_fit(actual, expected, rtol=1e-9):
+    ll, edge_communities, theta, _ = actual
+    expected_ll, expected_edge_communities, expected_theta, _ = expected
+    assert ll == pytest.approx(expected_ll, rel=rtol)
+    np.testing.assert_allclose(theta, expected_theta, rtol=rtol, atol=1e-12)
+    np.testing.assert_array_equal(edge_communities, expected_edge_communities)
+
+
+@pytest.mark.parametrize('seed', seeds)
+def test_blocked_matches_dense(les_miserables, seed):
+    dense = cd.fit_edge_communities(les_miserables, K, False, seed)
+    # blocks much smaller than the graph, so every pass runs over several blocks
+    blocked = cd.fit_edge_communities(les_miserables, K, False, seed, block_size=64)
+    assert_same_fit(blocked, dense)
+
+
+@pytest.mark.parametrize('seed', seeds)
+def test_symmetric_matches_dense(les_miserables, seed):
+    dense = cd.fit_edge_communities(les_miserables, K, False, seed)
+    symmetric = cd.fit_edge_communities(les_miserables, K, False, seed, symmetric=True)
+    assert_same_fit(symmetric, dense)
+    symmetric_blocked = cd.fit_edge_communities(les_miserables, K, False, seed, symmetric=True, block_size=64)
+    assert_same_fit(symmetric_blocked, dense)
+
+
+def test_parallel_trials_match_serial(les_miserables):
+    serial = cd.get_communities(les_miserables, K, 3, False, seed=7, num_workers=1)
+    parallel = cd.get_communities(les_miserables, K, 3, False, seed=7, num_workers=2)
+    assert parallel.trial_seeds == serial.trial_seeds
+    np.testing.assert_allclose(parallel.trial_log_likelihoods, serial.trial_log_likelihoods, rtol=1e-12)
+    assert parallel.seed == serial.seed
+    np.testing.assert_array_equal(parallel.edge_communities, serial.edge_communities)
+    # and the best trial is the same fit as running its seed directly
+    assert_same_fit((parallel.ll, parallel.edge_communities, parallel.theta, parallel.q_theta),
+                    cd.fit_edge_communities(les_miserables, K, False, parallel.seed))
+
+
+@pytest.mark.parametrize('block_size', [None, 64])
+def test_resumed_run_matches_uninterrupted(les_miserables, tmp_path, block_size):
+    uninterrupted = cd.fit_edge_communities(les_miserables, K, False, 1, block_size=block_size)
+    checkpoint_path = str(tmp_path / 'checkpoint.npz')
+    cd.fit_edge_communities(les_miserables, K, False, 1, block_size=block_size, checkpoint_path=checkpoint_path,
+                            num_iterations_per_checkpoint=2, max_iterations=5)
+    trace = cd.EMTrace()
+    # the seed of the resumed run does not matter: the random state is restored from the checkpoint
+    resumed = cd.fit_edge_communities(les_miserables, K, False, None, block_size=block_size,
+                                      checkpoint_path=checkpoint_path, callback=trace)
+    assert trace.records[0]['resumed'] and trace.records[0]['iteration'] == 5
+    assert_same_fit(resumed, uninterrupted, rtol=1e-12)
+
+    # resuming a finished run runs no more iterations
+    trace = cd.EMTrace()
+    finished = cd.fit_edge_communities(les_miserables, K, False, None, block_size=block_size,
+                                       checkpoint_path=checkpoint_path, callback=trace)
+    assert trace.records[-1]['iterations'] == 0
+    assert_same_fit(finished, uninterrupted, rtol=1e-12)
+
+
+def test_resumed_trials_match_uninterrupted(les_miserables, tmp_path):
+    uninterrupted = cd.get_communities(les_miserables, K, 2, False, seed=3, num_workers=1)
+    checkpoint_directory = str(tmp_path / 'checkpoints')
+    cd.get_communities(les_miserables, K, 2, False, seed=3, num_workers=1, checkpoint_directory=checkpoint_directory,
+                       max_iterations=4)
+    # without a seed, the master seed is read back from the checkpoint directory
+    resumed = cd.get_communities(les_miserables, K, 2, False, num_workers=1, checkpoint_directory=checkpoint_directory)
+    assert resumed.master_seed == 3
+    np.testing.assert_allclose(resumed.trial_log_likelihoods, uninterrupted.trial_log_likelihoods, rtol=1e-12)
+    np.testing.assert_array_equal(resumed.edge_communities, uninterrupted.edge_communities)
+
+
+def test_max_iterations(les_miserables):
+    trace = cd.EMTrace()
+    cd.fit_edge_communities(les_miserables, K, False, 0, max_iterations=3, callback=trace)
+    assert [record['iteration'] for record in trace.records if record['event'] == 'iteration'] == [1, 2, 3]
+    assert trace.records[-1]['iterations'] == 3
+
+
+# the log-likelihoods of a random initialization and of a converged dense run bound the approximate modes
+def dense_bounds(graph, seed):
+    initial_ll = cd.fit_edge_communities(graph, K, False, seed, max_iterations=0)[0]
+    dense_ll = cd.fit_edge_communities(graph, K, False, seed)[0]
+    return initial_ll, dense_ll
+
+
+@pytest.mark.parametrize('seed', seeds)
+@pytest.mark.parametrize('max_memberships', [2, 3])
+def test_sparse_terminates_within_dense_bounds(les_miserables, seed, max_memberships):
+    trace = cd.EMTrace()
+    ll, edge_communities, theta, q_theta = cd.fit_edge_communities(les_miserables, K, False, seed, max_memberships=max_memberships,
+                                                                   max_iterations=50, callback=trace)
+    end = trace.records[-1]
+    assert end['event'] == 'end' and end['iterations'] <= 50
+    # the reported log-likelihood is the true one of the returned (untruncated) theta, comparable to dense runs
+    assert ll == pytest.approx(cd.log_likelihood(cd.EMEdges(les_miserables), theta.toarray())[0], rel=1e-9)
+    assert len(edge_communities) == les_miserables.m
+    # the edge communities come from a theta with at most max_memberships communities per vertex
+    assert np.all(q_theta.getnnz(axis=1) <= max_memberships)
+    initial_ll, dense_ll = dense_bounds(les_miserables, seed)
+    assert initial_ll <= ll <= dense_ll + 0.01 * abs(dense_ll)
+
+
+@pytest.mark.parametrize('seed', seeds)
+@pytest.mark.parametrize('exact_iterations', [0, 5])
+def test_stochastic_terminates_within_dense_bounds(les_miserables, seed, exact_iterations):
+    trace = cd.EMTrace()
+    ll, edge_communities, theta, _ = cd.fit_edge_communities(les_miserables, K, False, seed, batch_size=100,
+                                                             exact_iterations=exact_iterations, callback=trace)
+    end = trace.records[-1]
+    assert end['epochs'] <= cd.max_stochastic_epochs and end['iterations'] <= exact_iterations
+    assert ll == pytest.approx(cd.log_likelihood(cd.EMEdges(les_miserables), theta)[0], rel=1e-9)
+    assert len(edge_communities) == les_miserables.m
+    initial_ll, dense_ll = dense_bounds(les_miserables, seed)
+    # epochs keep the best theta, so they never end below the initialization
+    assert initial_ll <= ll <= dense_ll + 0.01 * abs(dense_ll)
+
+
+def test_information_criterion_prefers_higher_log_likelihood(les_miserables):
+    assert cd.information_criterion(les_miserables, 10.0, K) < cd.information_criterion(les_miserables, 0.0, K)
+    assert cd.information_criterion(les_miserables, 0.0, K) < cd.information_criterion(les_miserables, 0.0, K + 1)
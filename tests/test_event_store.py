@@ -0,0 +1,98 @@
+import json
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from event_store import EventStore, iter_json_array
+
+events = [
+    {'event_type': 'Borrow', 'item': {'uri': 'book1'}, 'member': {'uris': ['m1']}, 'start_date': '1921-03-17', 'end_date': '1921-04'},
+    {'event_type': 'Subscription', 'member': {'uris': ['m2']}, 'start_date': '1922'},
+    {'event_type': 'Borrow', 'item': {'uri': 'book2'}, 'member': {'uris': ['m1', 'm2']}, 'start_date': '1923-01-02'},
+    {'event_type': 'Purchase', 'item': {'uri': 'book1'}, 'member': {'uris': ['m3']}, 'start_date': '--05-01'},
+    {'event_type': 'Borrow', 'item': {'uri': 'book3'}, 'member': {'uris': []}},
+    {'event_type': 'Borrow', 'item': {'uri': 'book1'}, 'member': {'uris': ['m2']}, 'start_date': '1921-06-01'},
+    {'event_type': 'Borrow', 'item': None, 'member': {'uris': ['m3']}, 'start_date': '1924-01-01'},
+]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 1 << 20])
+def test_iter_json_array(tmp_path, chunk_size):
+    path = tmp_path / 'events.json'
+    # elements of every kind, cut at every position by the small chunk sizes
+    elements = events + [1, -2.5, 'a, b]', [], {}, None, True, [1, [2, 3]]]
+    path.write_text(json.dumps(elements, indent=2))
+    assert list(iter_json_array(str(path), chunk_size)) == elements
+
+
+@pytest.mark.parametrize('text', ['[]', '  [ ]\n', '[\n]'])
+def test_iter_json_array_empty(tmp_path, text):
+    path = tmp_path / 'empty.json'
+    path.write_text(text)
+    assert list(iter_json_array(str(path), 1)) == []
+
+
+@pytest.mark.parametrize('text', ['', '{"a": 1}', '[1, 2'])
+def test_iter_json_array_invalid(tmp_path, text):
+    path = tmp_path / 'invalid.json'
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(path), 2))
+
+
+# the borrower to books map from a scan over the event dicts
+def scan_borrower_to_books(events, keep_book_uris=None, start_date=None, end_date=None):
+    borrower_to_books = defaultdict(set)
+    for event in events:
+        book_uri = (event.get('item') or {}).get('uri')
+        date = event.get('start_date')
+        if event['event_type'] != 'Borrow' or book_uri is None:
+            continue
+        if keep_book_uris is not None and book_uri not in keep_book_uris:
+            continue
+        if (start_date is not None or end_date is not None) and (not date or date.startswith('-')):
+            continue
+        if start_date is not None and date < start_date:
+            continue
+        if end_date is not None and date >= end_date:
+            continue
+        for member_uri in event['member']['uris']:
+            borrower_to_books[member_uri].add(book_uri)
+    return borrower_to_books
+
+
+def test_event_store_from_json_file(tmp_path):
+    path = tmp_path / 'events.json'
+    path.write_text(json.dumps(events))
+    store = EventStore.from_json_file(str(path))
+    assert len(store) == len(events)
+    assert store.event_types == ['Borrow', 'Purchase', 'Subscription']
+    np.testing.assert_array_equal(store.type_offsets, [0, 5, 6, 7])
+    assert store.get_borrower_to_books() == EventStore.from_events(events).get_borrower_to_books()
+
+
+@pytest.mark.parametrize('keep_book_uris', [None, ['book1', 'book3', 'missing']])
+@pytest.mark.parametrize('start_date, end_date', [(None, None), ('1921-01-01', None), (None, '1923'), ('1921-04', '1924')])
+def test_get_borrower_to_books(keep_book_uris, start_date, end_date):
+    store = EventStore.from_events(events)
+    assert store.get_borrower_to_books(keep_book_uris, start_date, end_date) == \
+        scan_borrower_to_books(events, keep_book_uris, start_date, end_date)
+
+
+def test_count_events_per_book():
+    store = EventStore.from_events(events)
+    assert store.count_events_per_book() == {'book1': 3, 'book2': 1, 'book3': 1}
+    assert store.count_events_per_book(['Purchase']) == {'book1': 1}
+    assert store.count_events_per_book(start_date='1921-06-01') == {'book1': 1, 'book2': 1}
+
+
+def test_partial_dates():
+    store = EventStore.from_events(events)
+    # the events are sorted by type, and each type keeps the dataset order
+    borrows = store.select(['Borrow'])
+    np.testing.assert_array_equal(store.start_dates[borrows],
+                                  np.array(['1921-03-17', '1923-01-02', 'NaT', '1921-06-01', '1924-01-01'], dtype='datetime64[D]'))
+    np.testing.assert_array_equal(store.end_dates[borrows[:1]], np.array(['1921-04-01'], dtype='datetime64[D]'))
+    # dates without a year are unknown
+    assert np.isnat(store.start_dates[store.select(['Purchase'])][0])
@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+import pytest
+
+import graph as G
+
+
+# random readers with skewed numbers of books, some with only one
+def random_person_to_books(seed, num_people=300, num_books=60):
+    rng = np.random.default_rng(seed)
+    sizes = np.minimum(rng.geometric(0.15, num_people), num_books)
+    return {'reader{}'.format(i): ['book{:02d}'.format(b) for b in rng.choice(num_books, size, replace=False)]
+            for i, size in enumerate(sizes)}
+
+
+def assert_same_graph(actual, expected):
+    np.testing.assert_array_equal(actual.indptr, expected.indptr)
+    np.testing.assert_array_equal(actual.indices, expected.indices)
+    np.testing.assert_allclose(actual.weights, expected.weights, rtol=1e-12)
+
+
+@pytest.mark.parametrize('num_workers', [2, 4])
+@pytest.mark.parametrize('weighting', [None, 'per_user'])
+def test_sharded_projection_matches_project_incidence(num_workers, weighting):
+    _, incidence, _ = G.get_reader_book_incidence(random_person_to_books(0))
+    reader_weights = None
+    if weighting is not None:
+        reader_weights = G.per_user_reader_weights(np.diff(incidence.indptr))
+    expected = G.project_incidence(incidence, reader_weights)
+    # min_pairs=0 shards even this small matrix
+    sharded = G.project_incidence_sharded(incidence, reader_weights, num_workers, min_pairs=0)
+    assert_same_graph(sharded, expected)
+    # below the threshold, the projection runs in this process
+    assert_same_graph(G.project_incidence_sharded(incidence, reader_weights, num_workers), expected)
+
+
+def test_split_incidence_rows():
+    _, incidence, _ = G.get_reader_book_incidence(random_person_to_books(1))
+    shards = G.split_incidence_rows(incidence, 3)
+    assert 1 <= len(shards) <= 3
+    rows = np.concatenate(shards)
+    # contiguous, in order, and every person with at least two books is in exactly one shard
+    np.testing.assert_array_equal(rows, np.flatnonzero(np.diff(incidence.indptr) >= 2))
+
+
+def test_builders_match_edge_list():
+    person_to_books = {'a': ['x', 'y', 'z'], 'b': ['y', 'z'], 'c': ['z', 'z', 'w'], 'd': ['v']}
+    books, book_to_vertex_index, graph = G.create_books_graph(person_to_books)
+    assert books == ['w', 'x', 'y', 'z']
+    pairs = [('x', 'y'), ('x', 'z'), ('y', 'z'), ('y', 'z'), ('z', 'w')]
+    expected = G.convert_edge_list_to_graph([book_to_vertex_index[u] for u, _ in pairs],
+                                            [book_to_vertex_index[v] for _, v in pairs], n=len(books))
+    assert_same_graph(graph, expected)
+    assert_same_graph(G.create_books_graph_sharded(person_to_books, 2)[2], expected)
+
+
+@pytest.fixture
+def cache_directory(tmp_path, monkeypatch):
+    directory = str(tmp_path / 'cache')
+    monkeypatch.setattr(G, 'graph_cache_directory', directory)
+    return directory
+
+
+@pytest.mark.parametrize('mmap_mode', [None, 'r'])
+def test_load_or_build_books_graph_caches(tmp_path, cache_directory, mmap_mode):
+    person_to_books = random_person_to_books(2)
+    input_path = tmp_path / 'input.txt'
+    input_path.write_text('version 1')
+    calls = []
+
+    def get_person_to_books():
+        calls.append(None)
+        return person_to_books
+
+    expected_books, _, expected = G.create_books_graph(person_to_books)
+    for _ in range(2):
+        books, book_to_vertex_index, graph = G.load_or_build_books_graph(G.create_books_graph, get_person_to_books,
+                                                                         [str(input_path)], mmap_mode)
+        assert books == expected_books
+        assert book_to_vertex_index == {book: i for i, book in enumerate(expected_books)}
+        assert_same_graph(graph, expected)
+    # the second call reads the cached graph
+    assert len(calls) == 1
+    # no temporary directories or files are left behind
+    assert not [name for name in os.listdir(cache_directory) if '.tmp-' in name]
+
+    # another builder, or a changed input file, builds a new graph
+    G.load_or_build_books_graph(G.create_books_graph_weighted_by_user, get_person_to_books, [str(input_path)], mmap_mode)
+    assert len(calls) == 2
+    input_path.write_text('version 2')
+    G.load_or_build_books_graph(G.create_books_graph, get_person_to_books, [str(input_path)], mmap_mode)
+    assert len(calls) == 3
+
+
+def test_file_digest(tmp_path, cache_directory):
+    path = tmp_path / 'input.txt'
+    path.write_text('some data')
+    digest = G.file_digest(str(path))
+    assert G.file_digest(str(path)) == digest
+    assert os.listdir(cache_directory) == ['digests.json']
+    path.write_text('other data')
+    assert G.file_digest(str(path)) != digest
+
+
+def test_load_or_compute_json(tmp_path, cache_directory):
+    path = tmp_path / 'input.txt'
+    path.write_text('some data')
+    calls = []
+
+    def compute():
+        calls.append(None)
+        return {'a': 1}
+
+    assert G.load_or_compute_json('counts', compute, [str(path)]) == {'a': 1}
+    assert G.load_or_compute_json('counts', compute, [str(path)]) == {'a': 1}
+    assert len(calls) == 1